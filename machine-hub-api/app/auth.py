@@ -1,11 +1,14 @@
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+import hashlib
+import hmac
 import os
+import time
 from dotenv import load_dotenv
 
 from .database import get_db
@@ -18,15 +21,36 @@ SECRET_KEY = os.getenv("BACKEND_SECRET_KEY", "supersecret_jwt_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing: argon2 for new hashes, existing bcrypt hashes still verify.
+# Costs can be lowered via env for faster dev/test environments.
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default="argon2",
+    argon2__time_cost=int(os.getenv("ARGON2_TIME_COST", "2")),
+    argon2__memory_cost=int(os.getenv("ARGON2_MEMORY_COST", "19456")),
+    argon2__parallelism=1,
+    deprecated="auto"
+)
 
 # HTTP Bearer token scheme
 security = HTTPBearer()
 
+# Verified bearer tokens: blake2b(token) -> (valid_until, user). A hit skips
+# the JWT signature check and loading the user; only the user's is_active
+# flag is re-read, so a deactivated or deleted user is locked out at once.
+# Entries never outlive the token's own exp and are re-verified at least
+# every TOKEN_CACHE_TTL seconds
+TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", "300"))
+TOKEN_CACHE_MAX_SIZE = 10000
+_token_cache: Dict[bytes, Tuple[float, schemas.User]] = {}
+
+
+def _token_key(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
 
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
+    """Hash a password using argon2"""
     return pwd_context.hash(password)
 
 
@@ -73,7 +97,7 @@ def verify_token(token: str) -> Optional[schemas.TokenData]:
         return None
 
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
     """Get the current authenticated user from JWT token"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -81,7 +105,17 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         headers={"WWW-Authenticate": "Bearer"},
     )
 
-    token_data = verify_token(credentials.credentials)
+    token = credentials.credentials
+    key = _token_key(token)
+    cached = _token_cache.get(key)
+    if cached and time.time() < cached[0]:
+        if crud.is_user_active(db, cached[1].id):
+            return cached[1]
+        # Deactivated or deleted since it was cached: the full check below
+        # raises the matching error
+        _token_cache.pop(key, None)
+
+    token_data = verify_token(token)
     if token_data is None:
         raise credentials_exception
 
@@ -95,21 +129,38 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Inactive user"
         )
 
-    return user
+    # Cache a session-independent copy of the user until the token expires
+    current_user = schemas.User.model_validate(user)
+    if len(_token_cache) >= TOKEN_CACHE_MAX_SIZE:
+        _token_cache.clear()
+    expires_at = jwt.get_unverified_claims(token)["exp"]
+    _token_cache[key] = (min(expires_at, time.time() + TOKEN_CACHE_TTL), current_user)
+
+    return current_user
 
 
-async def get_current_active_user(current_user=Depends(get_current_user)):
+def get_current_active_user(current_user=Depends(get_current_user)):
     """Get the current active user (alias for get_current_user)"""
     return current_user
 
 # Optional: API Key authentication for webhooks
 
 
-def verify_api_key(api_key: str) -> bool:
+def verify_api_key(api_key: Optional[str]) -> bool:
     """Verify API key for webhook endpoints"""
     # For now, just check against environment variable
     # In production, you might want to store API keys in database
     expected_key = os.getenv("GLANCES_SECRET")
     if not expected_key:
         return True  # If no secret is set, allow all requests
-    return api_key == expected_key
+    # Constant-time comparison so the key can't be probed byte by byte
+    return hmac.compare_digest((api_key or "").encode(), expected_key.encode())
+
+
+def require_api_key(x_secret: Optional[str] = Header(None)):
+    """Dependency that rejects webhook requests before the body is read"""
+    if not verify_api_key(x_secret):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or missing API key"
+        )
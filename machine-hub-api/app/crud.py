@@ -1,7 +1,10 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_
-from typing import Optional, List
+from sqlalchemy.orm import Session, aliased, defer, raiseload, selectinload
+from sqlalchemy import desc, and_, or_, insert, select, text, update, Row
+from sqlalchemy.exc import IntegrityError
+from typing import Any, Optional, List, Dict, Tuple
 from datetime import datetime, timedelta
+import os
+import time
 
 from . import models, schemas
 from .auth import hash_password
@@ -29,8 +32,16 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
     return db_user
 
 
+def is_user_active(db: Session, user_id: int) -> bool:
+    """Whether the user still exists and is active (one primary-key lookup)"""
+    return bool(db.execute(
+        select(models.User.is_active).where(models.User.id == user_id)
+    ).scalar())
+
+
 def get_users(db: Session, skip: int = 0, limit: int = 100) -> List[models.User]:
-    return db.query(models.User).offset(skip).limit(limit).all()
+    return db.query(models.User).options(
+        raiseload('*')).offset(skip).limit(limit).all()
 
 # Machine CRUD operations
 
@@ -39,6 +50,13 @@ def get_machine(db: Session, machine_id: int) -> Optional[models.Machine]:
     return db.query(models.Machine).filter(models.Machine.id == machine_id).first()
 
 
+def get_machines_by_ids(db: Session, machine_ids: List[int]) -> List[models.Machine]:
+    """Fetch several machines in one IN (...) query"""
+    return db.query(models.Machine).options(
+        raiseload(models.Machine.snapshots)
+    ).filter(models.Machine.id.in_(machine_ids)).all()
+
+
 def get_machine_by_hostname(db: Session, hostname: str) -> Optional[models.Machine]:
     return db.query(models.Machine).filter(models.Machine.hostname == hostname).first()
 
@@ -47,8 +65,93 @@ def get_machine_by_ip(db: Session, ip_address: str) -> Optional[models.Machine]:
     return db.query(models.Machine).filter(models.Machine.ip_address == ip_address).first()
 
 
-def get_machines(db: Session, skip: int = 0, limit: int = 100, active_only: bool = True) -> List[models.Machine]:
+# Webhook routing cache: (column, value) -> (fetched_at, machine row). Machines
+# rarely change, and every machine write below clears it. IP lookups also
+# cache misses (row None), so an unregistered external IP costs no query.
+# Those IPs come from request bodies, so the cache is emptied once it holds
+# MACHINE_LOOKUP_MAX_SIZE entries
+MACHINE_LOOKUP_TTL = float(os.getenv("MACHINE_LOOKUP_TTL", "60"))
+MACHINE_LOOKUP_MAX_SIZE = 10000
+_machine_lookup_cache: Dict[Tuple[str, str], Tuple[float, Optional[Row]]] = {}
+
+
+_MACHINE_REF_COLUMNS = (
+    models.Machine.id,
+    models.Machine.name,
+    models.Machine.hostname,
+    models.Machine.ip_address,
+    models.Machine.os_name,
+    models.Machine.os_version
+)
+
+
+def _cached_machine_ref(column, value: str) -> Optional[Tuple[float, Optional[Row]]]:
+    """Fresh cache entry for this lookup, or None when it has to be queried"""
+    cached = _machine_lookup_cache.get((column.key, value))
+    if cached and time.monotonic() - cached[0] < MACHINE_LOOKUP_TTL:
+        return cached
+    return None
+
+
+def _cache_machine_ref(column, value: str, fetched_at: float, row: Optional[Row]) -> None:
+    if len(_machine_lookup_cache) >= MACHINE_LOOKUP_MAX_SIZE:
+        _machine_lookup_cache.clear()
+    _machine_lookup_cache[(column.key, value)] = (fetched_at, row)
+
+
+def _get_machine_ref(db: Session, column, value: str) -> Optional[Row]:
+    cached = _cached_machine_ref(column, value)
+    if cached is not None and cached[1] is not None:
+        return cached[1]
+
+    row = db.execute(
+        select(*_MACHINE_REF_COLUMNS).where(column == value).limit(1)
+    ).first()
+    if row is not None:
+        _cache_machine_ref(column, value, time.monotonic(), row)
+    return row
+
+
+def get_machine_ref_by_any_ip(db: Session, ip_addresses: List[str]) -> Optional[Row]:
+    """Cached machine columns for the first IP (in the given order) that is registered"""
+    column = models.Machine.ip_address
+    cached = [_cached_machine_ref(column, ip) for ip in ip_addresses]
+    if all(entry is not None for entry in cached):
+        return next((row for _, row in cached if row is not None), None)
+
+    # Any IP missing from the cache could outrank the cached ones, so all of
+    # them are looked up again in one IN (...) query
+    rows = db.execute(
+        select(*_MACHINE_REF_COLUMNS).where(column.in_(ip_addresses))
+    ).all()
+    now = time.monotonic()
+    by_ip = {}
+    for row in rows:
+        by_ip.setdefault(row.ip_address, row)
+    for ip_address in ip_addresses:
+        _cache_machine_ref(column, ip_address, now, by_ip.get(ip_address))
+
+    return next((by_ip[ip] for ip in ip_addresses if ip in by_ip), None)
+
+
+def get_machine_ref_by_hostname(db: Session, hostname: str) -> Optional[Row]:
+    """Cached id/name/hostname/OS columns of the machine with this hostname"""
+    return _get_machine_ref(db, models.Machine.hostname, hostname)
+
+
+def invalidate_machine_lookups() -> None:
+    _machine_lookup_cache.clear()
+
+
+def get_machines(db: Session, skip: int = 0, limit: int = 100, active_only: bool = True, load_snapshots: bool = False) -> List[models.Machine]:
     query = db.query(models.Machine)
+    if load_snapshots:
+        # One extra IN (...) query for all snapshots instead of one per machine
+        query = query.options(selectinload(
+            models.Machine.snapshots).options(raiseload('*')), raiseload('*'))
+    else:
+        # Fail fast on accidental lazy loads from list views
+        query = query.options(raiseload('*'))
     if active_only:
         query = query.filter(models.Machine.is_active == True)
     return query.offset(skip).limit(limit).all()
@@ -56,18 +159,90 @@ def get_machines(db: Session, skip: int = 0, limit: int = 100, active_only: bool
 
 def get_active_machines(db: Session) -> List[models.Machine]:
     """Get all active machines for polling"""
-    return db.query(models.Machine).filter(models.Machine.is_active == True).all()
+    return db.query(models.Machine).options(
+        raiseload(models.Machine.snapshots)
+    ).filter(models.Machine.is_active == True).all()
+
+
+def get_active_machines_lite(db: Session) -> List[Row]:
+    """Get only the columns the poller reads for all active machines"""
+    return db.execute(
+        select(
+            models.Machine.id,
+            models.Machine.name,
+            models.Machine.hostname,
+            models.Machine.ip_address,
+            models.Machine.os_name,
+            models.Machine.os_version
+        ).where(models.Machine.is_active == True)
+    ).all()
+
+
+def _system_info_update(machine_id: int, system_info: dict):
+    return (
+        update(models.Machine)
+        .where(models.Machine.id == machine_id)
+        .where(or_(*(
+            getattr(models.Machine, field).is_distinct_from(value)
+            for field, value in system_info.items()
+        )))
+        .values(**system_info)
+        .execution_options(synchronize_session=False)
+    )
+
+
+def update_machine_system_info(db: Session, machine_id: int, system_info: dict) -> bool:
+    """Write reported os_name/os_version/hostname without loading the machine
+
+    The WHERE guard makes the UPDATE a server-side no-op when every value is
+    already current; only an actual change is committed. A hostname already
+    taken by another machine is left out rather than failing the update.
+    Returns whether a row changed.
+    """
+    if not system_info:
+        return False
+
+    try:
+        result = db.execute(_system_info_update(machine_id, system_info))
+    except IntegrityError:
+        db.rollback()
+        if "hostname" not in system_info:
+            raise
+        system_info = {field: value for field, value in system_info.items()
+                       if field != "hostname"}
+        if not system_info:
+            return False
+        result = db.execute(_system_info_update(machine_id, system_info))
+    if result.rowcount == 0:
+        db.rollback()
+        return False
+
+    db.commit()
+    invalidate_machine_lookups()
+    return True
+
+
+def _commit_machine_write(db: Session):
+    """Commit, rolling back before re-raising a duplicate hostname"""
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise
 
 
 def create_machine(db: Session, machine: schemas.MachineCreate) -> models.Machine:
+    """Insert a machine; raises IntegrityError when the hostname is taken"""
     db_machine = models.Machine(**machine.dict())
     db.add(db_machine)
-    db.commit()
+    _commit_machine_write(db)
+    invalidate_machine_lookups()
     db.refresh(db_machine)
     return db_machine
 
 
 def update_machine(db: Session, machine_id: int, machine_update: schemas.MachineUpdate) -> Optional[models.Machine]:
+    """Apply the set fields; raises IntegrityError when the hostname is taken"""
     db_machine = get_machine(db, machine_id)
     if not db_machine:
         return None
@@ -76,7 +251,8 @@ def update_machine(db: Session, machine_id: int, machine_update: schemas.Machine
     for field, value in update_data.items():
         setattr(db_machine, field, value)
 
-    db.commit()
+    _commit_machine_write(db)
+    invalidate_machine_lookups()
     db.refresh(db_machine)
     return db_machine
 
@@ -88,48 +264,74 @@ def delete_machine(db: Session, machine_id: int) -> bool:
 
     db.delete(db_machine)
     db.commit()
+    invalidate_machine_lookups()
     return True
 
+# System snapshot CRUD operations
 
-def update_machine_last_seen(db: Session, machine_id: int) -> Optional[models.Machine]:
-    db_machine = get_machine(db, machine_id)
-    if not db_machine:
-        return None
-
-    db_machine.last_seen = datetime.utcnow()
+# History lists only need scalar metrics; skip the wide JSON columns and the
+# machine relationship, raising instead of lazy-loading them row by row
+_DEFER_SNAPSHOT_PAYLOAD = (
+    defer(models.SystemSnapshot.sensors_data, raiseload=True),
+    defer(models.SystemSnapshot.alert_data, raiseload=True),
+    defer(models.SystemSnapshot.network_data, raiseload=True),
+    defer(models.SystemSnapshot.fs_data, raiseload=True),
+    raiseload('*'),
+)
+
+
+def create_system_snapshots_bulk(db: Session, snapshots: List[schemas.SystemSnapshotDict]) -> int:
+    """Insert a batch of snapshot column dicts and stamp last_seen with one commit"""
+    if not snapshots:
+        return 0
+
+    # Multi-row INSERT instead of one INSERT + COMMIT per snapshot
+    db.execute(insert(models.SystemSnapshot), snapshots)
+
+    # Every machine in the batch was seen now, so one UPDATE covers them all
+    machine_ids = {snapshot["machine_id"] for snapshot in snapshots}
+    db.execute(
+        update(models.Machine)
+        .where(models.Machine.id.in_(machine_ids))
+        .values(last_seen=datetime.utcnow())
+    )
     db.commit()
-    db.refresh(db_machine)
-    return db_machine
-
-# System snapshot CRUD operations
+    return len(snapshots)
 
 
-def create_system_snapshot(db: Session, snapshot: schemas.SystemSnapshotCreate) -> models.SystemSnapshot:
-    db_snapshot = models.SystemSnapshot(**snapshot.dict())
-    db.add(db_snapshot)
-    db.commit()
-    db.refresh(db_snapshot)
+# JSON payload columns that metric dashboards rarely need
+SNAPSHOT_PAYLOAD_COLUMNS = frozenset(
+    {"sensors_data", "alert_data", "network_data", "fs_data"})
 
-    # Update machine's last_seen timestamp
-    update_machine_last_seen(db, snapshot.machine_id)
 
-    return db_snapshot
+def _snapshot_columns(include_payload: bool):
+    return [column for column in models.SystemSnapshot.__table__.c
+            if include_payload or column.name not in SNAPSHOT_PAYLOAD_COLUMNS]
 
 
-def get_latest_snapshot(db: Session, machine_id: int) -> Optional[models.SystemSnapshot]:
-    return db.query(models.SystemSnapshot).filter(
-        models.SystemSnapshot.machine_id == machine_id
-    ).order_by(desc(models.SystemSnapshot.created_at)).first()
+def get_latest_snapshot(db: Session, machine_id: int, include_payload: bool = False) -> Optional[Row]:
+    """Latest snapshot as plain columns, JSON payloads only when asked for"""
+    return db.execute(
+        select(*_snapshot_columns(include_payload))
+        .where(models.SystemSnapshot.machine_id == machine_id)
+        .order_by(desc(models.SystemSnapshot.created_at)).limit(1)
+    ).first()
 
 
-def get_machine_snapshots(db: Session, machine_id: int, limit: int = 100) -> List[models.SystemSnapshot]:
-    return db.query(models.SystemSnapshot).filter(
-        models.SystemSnapshot.machine_id == machine_id
-    ).order_by(desc(models.SystemSnapshot.created_at)).limit(limit).all()
+def get_machine_snapshots(db: Session, machine_id: int, limit: int = 100, include_payload: bool = False) -> List[Row]:
+    """Snapshot history as plain columns, JSON payloads only when asked for"""
+    return db.execute(
+        select(*_snapshot_columns(include_payload))
+        .where(models.SystemSnapshot.machine_id == machine_id)
+        .order_by(desc(models.SystemSnapshot.created_at)).limit(limit)
+    ).all()
 
 
 def get_snapshots_in_timerange(db: Session, machine_id: int, start_time: datetime, end_time: datetime) -> List[models.SystemSnapshot]:
-    return db.query(models.SystemSnapshot).filter(
+    """Snapshot history in a time range without the JSON payload columns"""
+    return db.query(models.SystemSnapshot).options(
+        *_DEFER_SNAPSHOT_PAYLOAD
+    ).filter(
         and_(
             models.SystemSnapshot.machine_id == machine_id,
             models.SystemSnapshot.created_at >= start_time,
@@ -138,64 +340,89 @@ def get_snapshots_in_timerange(db: Session, machine_id: int, start_time: datetim
     ).order_by(desc(models.SystemSnapshot.created_at)).all()
 
 
-def cleanup_old_snapshots(db: Session, days_to_keep: int = 30) -> int:
+def get_snapshot_detail(db: Session, snapshot_id: int) -> Optional[models.SystemSnapshot]:
+    """Single snapshot with every column, including the JSON payloads"""
+    return db.query(models.SystemSnapshot).filter(
+        models.SystemSnapshot.id == snapshot_id
+    ).first()
+
+
+def cleanup_old_snapshots(db: Session, days_to_keep: int = 30, batch_size: int = 10000, pause_seconds: float = 0.1) -> int:
     """Remove snapshots older than specified days"""
     cutoff_date = datetime.utcnow() - timedelta(days=days_to_keep)
-    deleted_count = db.query(models.SystemSnapshot).filter(
-        models.SystemSnapshot.created_at < cutoff_date
-    ).delete()
-    db.commit()
+    deleted_count = 0
+
+    # Delete in bounded batches, committing each one, so row locks and undo
+    # log stay small and concurrent snapshot inserts are not stalled
+    while True:
+        deleted = db.execute(text("""
+            DELETE FROM system_snapshots
+            WHERE created_at < :cutoff
+            ORDER BY created_at
+            LIMIT :batch_size
+        """), {"cutoff": cutoff_date, "batch_size": batch_size}).rowcount
+        db.commit()
+        deleted_count += deleted
+
+        if deleted < batch_size:
+            break
+        time.sleep(pause_seconds)
+
     return deleted_count
 
 
-def cleanup_snapshots_by_count(db: Session, max_records_per_machine: int = 10000) -> int:
+def cleanup_snapshots_by_count(db: Session, max_records_per_machine: int = 10000, chunk_size: int = 5000, pause_seconds: float = 0.1) -> int:
     """Keep only the latest N records per machine, delete older ones"""
-    total_deleted = 0
-
-    # Get all machines
-    machines = db.query(models.Machine).all()
+    # Find only the machines that are over the limit (index-only scan on
+    # machine_id), then trim each one oldest-first
+    over_limit = db.execute(text("""
+        SELECT machine_id, COUNT(*) AS total
+        FROM system_snapshots
+        GROUP BY machine_id
+        HAVING COUNT(*) > :max_records
+    """), {"max_records": max_records_per_machine}).all()
 
-    for machine in machines:
-        # Count total snapshots for this machine
-        total_snapshots = db.query(models.SystemSnapshot).filter(
-            models.SystemSnapshot.machine_id == machine.id
-        ).count()
-
-        if total_snapshots > max_records_per_machine:
-            # Get the IDs of snapshots to delete (oldest ones)
-            snapshots_to_delete = db.query(models.SystemSnapshot.id).filter(
-                models.SystemSnapshot.machine_id == machine.id
-            ).order_by(desc(models.SystemSnapshot.created_at)).offset(max_records_per_machine).all()
-
-            if snapshots_to_delete:
-                # Extract just the IDs
-                snapshot_ids = [
-                    snapshot.id for snapshot in snapshots_to_delete]
-
-                # Delete the old snapshots
-                deleted_count = db.query(models.SystemSnapshot).filter(
-                    models.SystemSnapshot.id.in_(snapshot_ids)
-                ).delete(synchronize_session=False)
-
-                total_deleted += deleted_count
+    total_deleted = 0
+    for machine_id, total in over_limit:
+        excess = total - max_records_per_machine
+
+        # Bounded chunks, each committed, so no single statement holds locks
+        # on tens of thousands of rows while snapshots keep arriving
+        while excess > 0:
+            deleted = db.execute(text("""
+                DELETE FROM system_snapshots
+                WHERE machine_id = :machine_id
+                ORDER BY created_at ASC
+                LIMIT :chunk
+            """), {"machine_id": machine_id, "chunk": min(chunk_size, excess)}).rowcount
+            db.commit()
+            total_deleted += deleted
+            excess -= deleted
+
+            if deleted == 0:
+                break
+            if excess > 0:
+                time.sleep(pause_seconds)
 
-    db.commit()
     return total_deleted
 
 # Helper functions
 
 
-def get_machines_with_latest_snapshots(db: Session, skip: int = 0, limit: int = 100, active_only: bool = True) -> List[dict]:
-    """Get machines with their latest system snapshots"""
-    machines = get_machines(db, skip, limit, active_only)
-    result = []
+def get_machines_with_latest_snapshots(db: Session, skip: int = 0, limit: int = 100, active_only: bool = True) -> List[Tuple[models.Machine, Optional[models.SystemSnapshot]]]:
+    """Get (machine, latest snapshot) pairs in a single query"""
+    # Resolve each machine's newest snapshot id with a correlated subquery so
+    # machines and snapshots come back from a single query instead of 1 + N
+    newer = aliased(models.SystemSnapshot)
+    latest_snapshot_id = select(newer.id).where(
+        newer.machine_id == models.Machine.id
+    ).order_by(desc(newer.created_at), desc(newer.id)).limit(1).correlate(
+        models.Machine).scalar_subquery()
 
-    for machine in machines:
-        latest_snapshot = get_latest_snapshot(db, machine.id)
-        machine_dict = {
-            "machine": machine,
-            "latest_snapshot": latest_snapshot
-        }
-        result.append(machine_dict)
+    query = db.query(models.Machine, models.SystemSnapshot).outerjoin(
+        models.SystemSnapshot, models.SystemSnapshot.id == latest_snapshot_id
+    ).options(raiseload('*'))
+    if active_only:
+        query = query.filter(models.Machine.is_active == True)
 
-    return result
+    return [tuple(row) for row in query.offset(skip).limit(limit).all()]
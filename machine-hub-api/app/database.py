@@ -16,16 +16,27 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "controlpass")
 # Generate DATABASE_URL dynamically
 DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
+# Connection pool sizing. pool_size + max_overflow connections per worker
+# must fit within MySQL's max_connections.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_POOL_OVERFLOW = int(os.getenv("DB_POOL_OVERFLOW", "40"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
 # Create SQLAlchemy engine
 engine = create_engine(
     DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_OVERFLOW,
     pool_pre_ping=True,
-    pool_recycle=300,
+    pool_recycle=DB_POOL_RECYCLE,
+    insertmanyvalues_page_size=1000,  # Rows per multi-row INSERT batch
     echo=False  # Set to True for SQL debugging
 )
 
-# Create SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create SessionLocal class. Objects keep their loaded state after commit;
+# call db.refresh() where server-generated values are needed.
+SessionLocal = sessionmaker(
+    autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 # Create Base class for models
 Base = declarative_base()
@@ -36,4 +47,11 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def warm_up_pool():
+    """Open pool_size connections up front so early requests skip the connect"""
+    connections = [engine.connect() for _ in range(DB_POOL_SIZE)]
+    for connection in connections:
+        connection.close()
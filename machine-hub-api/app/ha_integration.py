@@ -1,6 +1,8 @@
-import requests
+import asyncio
+import httpx
 import os
-from typing import Optional, Dict, Any
+import time
+from typing import Optional, Dict, Any, Tuple
 from dotenv import load_dotenv
 import logging
 from wakeonlan import send_magic_packet
@@ -17,78 +19,105 @@ class HomeAssistantClient:
             "Authorization": f"Bearer {self.token}",
             "Content-Type": "application/json"
         }
+
+        # Shared keep-alive client so HA calls reuse connections and never
+        # block the event loop
+        self.client = httpx.AsyncClient(
+            base_url=(self.base_url or "").rstrip("/"),
+            headers=self.headers,
+            timeout=httpx.Timeout(5.0, connect=2.0),
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=16),
+            transport=httpx.AsyncHTTPTransport(retries=2, http2=True)
+        )
+
+        # Short-lived entity state cache: entity_id -> (fetched_at, state)
+        self.state_ttl = float(os.getenv("HOME_ASSISTANT_STATE_TTL", "2"))
+        self._state_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
     
     def is_configured(self) -> bool:
         """Check if Home Assistant is properly configured"""
         return bool(self.base_url and self.token)
     
-    def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
+    async def aclose(self):
+        """Close the underlying HTTP client"""
+        await self.client.aclose()
+    
+    async def _make_request(self, method: str, endpoint: str, data: Optional[Dict] = None) -> Optional[Dict[str, Any]]:
         """Make a request to Home Assistant API"""
         if not self.is_configured():
             logger.warning("Home Assistant not configured")
             return None
         
-        url = f"{self.base_url.rstrip('/')}/api/{endpoint.lstrip('/')}"
+        url = f"/api/{endpoint.lstrip('/')}"
         
         try:
-            response = requests.request(
+            response = await self.client.request(
                 method=method,
                 url=url,
-                headers=self.headers,
-                json=data,
-                timeout=10
+                json=data
             )
             response.raise_for_status()
             return response.json() if response.content else {"success": True}
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Home Assistant API request failed: {e}")
             return None
     
-    def get_entity_state(self, entity_id: str) -> Optional[Dict[str, Any]]:
+    async def get_entity_state(self, entity_id: str) -> Optional[Dict[str, Any]]:
         """Get the state of a Home Assistant entity"""
-        return self._make_request("GET", f"states/{entity_id}")
+        cached = self._state_cache.get(entity_id)
+        if cached and time.monotonic() - cached[0] < self.state_ttl:
+            return cached[1]
+
+        state = await self._make_request("GET", f"states/{entity_id}")
+        if state is not None:
+            self._state_cache[entity_id] = (time.monotonic(), state)
+        return state
     
-    def call_service(self, domain: str, service: str, entity_id: str, **kwargs) -> Optional[Dict[str, Any]]:
+    async def call_service(self, domain: str, service: str, entity_id: str, **kwargs) -> Optional[Dict[str, Any]]:
         """Call a Home Assistant service"""
         data = {
             "entity_id": entity_id,
             **kwargs
         }
-        return self._make_request("POST", f"services/{domain}/{service}", data)
+        return await self._make_request("POST", f"services/{domain}/{service}", data)
     
-    def turn_on_switch(self, entity_id: str) -> bool:
+    async def turn_on_switch(self, entity_id: str) -> bool:
         """Turn on a switch entity"""
-        result = self.call_service("switch", "turn_on", entity_id)
+        result = await self.call_service("switch", "turn_on", entity_id)
+        if result is not None:
+            self._state_cache.pop(entity_id, None)
         return result is not None
     
-    def turn_off_switch(self, entity_id: str) -> bool:
+    async def turn_off_switch(self, entity_id: str) -> bool:
         """Turn off a switch entity"""
-        result = self.call_service("switch", "turn_off", entity_id)
+        result = await self.call_service("switch", "turn_off", entity_id)
+        if result is not None:
+            self._state_cache.pop(entity_id, None)
         return result is not None
     
-    def get_switch_state(self, entity_id: str) -> Optional[str]:
+    async def get_switch_state(self, entity_id: str) -> Optional[str]:
         """Get the state of a switch (on/off)"""
-        state_data = self.get_entity_state(entity_id)
+        state_data = await self.get_entity_state(entity_id)
         if state_data:
             return state_data.get("state")
         return None
     
-    def is_switch_on(self, entity_id: str) -> bool:
+    async def is_switch_on(self, entity_id: str) -> bool:
         """Check if a switch is currently on"""
-        state = self.get_switch_state(entity_id)
+        state = await self.get_switch_state(entity_id)
         return state == "on"
 
 # Global Home Assistant client instance
 ha_client = HomeAssistantClient()
 
-def power_on_machine(machine) -> Dict[str, Any]:
+async def power_on_machine(machine) -> Dict[str, Any]:
     """Power on a machine using Home Assistant smart plug or Wake-on-LAN"""
     result = {"success": False, "message": "Unknown error", "method": None}
     
     # Try Home Assistant smart plug first
     if machine.ha_entity_id and ha_client.is_configured():
         try:
-            success = ha_client.turn_on_switch(machine.ha_entity_id)
+            success = await ha_client.turn_on_switch(machine.ha_entity_id)
             if success:
                 result.update({
                     "success": True,
@@ -105,7 +134,7 @@ def power_on_machine(machine) -> Dict[str, Any]:
     # Fallback to Wake-on-LAN if MAC address is available
     if machine.mac_address:
         try:
-            send_magic_packet(machine.mac_address)
+            await asyncio.to_thread(send_magic_packet, machine.mac_address)
             result.update({
                 "success": True,
                 "message": f"Wake-on-LAN packet sent to {machine.name} ({machine.mac_address})",
@@ -122,14 +151,14 @@ def power_on_machine(machine) -> Dict[str, Any]:
     
     return result
 
-def power_off_machine(machine) -> Dict[str, Any]:
+async def power_off_machine(machine) -> Dict[str, Any]:
     """Power off a machine using Home Assistant smart plug"""
     result = {"success": False, "message": "Unknown error", "method": None}
     
     # Only Home Assistant smart plug can power off
     if machine.ha_entity_id and ha_client.is_configured():
         try:
-            success = ha_client.turn_off_switch(machine.ha_entity_id)
+            success = await ha_client.turn_off_switch(machine.ha_entity_id)
             if success:
                 result.update({
                     "success": True,
@@ -146,13 +175,13 @@ def power_off_machine(machine) -> Dict[str, Any]:
     
     return result
 
-def get_machine_power_state(machine) -> Dict[str, Any]:
+async def get_machine_power_state(machine) -> Dict[str, Any]:
     """Get the current power state of a machine via Home Assistant"""
     result = {"success": False, "state": "unknown", "message": "Unknown error"}
     
     if machine.ha_entity_id and ha_client.is_configured():
         try:
-            state = ha_client.get_switch_state(machine.ha_entity_id)
+            state = await ha_client.get_switch_state(machine.ha_entity_id)
             if state:
                 result.update({
                     "success": True,
@@ -1,7 +1,9 @@
 import os
 import sys
-from sqlalchemy import create_engine, text
-from sqlalchemy.orm import sessionmaker
+from pathlib import Path
+import sqlparse
+from sqlalchemy import create_engine, inspect, literal, select, text, union_all
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 
@@ -20,8 +22,15 @@ except ImportError:
 # Load environment variables
 load_dotenv()
 
-# Password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Keep in step with auth.pwd_context so seeded passwords verify at login
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default="argon2",
+    argon2__time_cost=int(os.getenv("ARGON2_TIME_COST", "2")),
+    argon2__memory_cost=int(os.getenv("ARGON2_MEMORY_COST", "19456")),
+    argon2__parallelism=1,
+    deprecated="auto"
+)
 
 
 def hash_password(password: str) -> str:
@@ -57,11 +66,16 @@ def run_migrations():
     """Create all tables and run SQL migrations"""
     try:
         engine = create_engine(DATABASE_URL)
+
+        # On a fresh database create_all builds the current schema, so the
+        # SQL migrations only need to be recorded, not replayed
+        fresh_database = not inspect(engine).has_table("machines")
+
         Base.metadata.create_all(bind=engine)
         print("Database tables created successfully")
 
         # Run SQL migrations
-        run_sql_migrations(engine)
+        run_sql_migrations(engine, record_only=fresh_database)
 
         return engine
     except Exception as e:
@@ -69,20 +83,40 @@ def run_migrations():
         raise
 
 
-def run_sql_migrations(engine):
+def check_unique_hostnames(conn):
+    """Refuse the unique hostname index while machines still share a hostname"""
+    duplicates = conn.execute(text("""
+        SELECT hostname, GROUP_CONCAT(id ORDER BY id) AS machine_ids
+        FROM machines
+        WHERE hostname IS NOT NULL AND hostname <> 'unknown'
+        GROUP BY hostname
+        HAVING COUNT(*) > 1
+    """)).all()
+    if duplicates:
+        listing = "; ".join(
+            f"{row.hostname!r} (machine ids {row.machine_ids})" for row in duplicates)
+        raise RuntimeError(
+            f"Duplicate machine hostnames: {listing}. Rename or clear them, "
+            "then run init_db again")
+
+
+# Checks that must pass before a migration is applied to existing data
+MIGRATION_PRECHECKS = {
+    "004_add_unique_hostname_index_to_machines.sql": check_unique_hostnames,
+}
+
+
+def run_sql_migrations(engine, record_only: bool = False):
     """Execute SQL migration files from migrations directory"""
     try:
-        migrations_dir = os.path.join(os.path.dirname(
-            os.path.dirname(os.path.abspath(__file__))), 'migrations')
+        migrations_dir = Path(__file__).resolve().parent.parent / 'migrations'
 
-        if not os.path.exists(migrations_dir):
+        if not migrations_dir.exists():
             print("No migrations directory found, skipping SQL migrations")
             return
 
         # Get all .sql files and sort them
-        sql_files = [f for f in os.listdir(
-            migrations_dir) if f.endswith('.sql')]
-        sql_files.sort()
+        sql_files = sorted(migrations_dir.glob('*.sql'))
 
         if not sql_files:
             print("No SQL migration files found")
@@ -91,7 +125,7 @@ def run_sql_migrations(engine):
         print(f"Found {len(sql_files)} migration files")
 
         # Create migrations tracking table if it doesn't exist
-        with engine.connect() as conn:
+        with engine.begin() as conn:
             conn.execute(text("""
                 CREATE TABLE IF NOT EXISTS migration_history (
                     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -99,47 +133,48 @@ def run_sql_migrations(engine):
                     executed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """))
-            conn.commit()
 
             # Check which migrations have already been executed
             result = conn.execute(
                 text("SELECT filename FROM migration_history"))
             executed_migrations = {row[0] for row in result}
 
-            # Execute new migrations
-            for sql_file in sql_files:
-                if sql_file in executed_migrations:
-                    print(f"Migration {sql_file} already executed, skipping")
-                    continue
-
-                print(f"Executing migration: {sql_file}")
-
-                # Read and execute the SQL file
-                file_path = os.path.join(migrations_dir, sql_file)
-                with open(file_path, 'r') as f:
-                    sql_content = f.read()
-
-                # Split by semicolon and execute each statement
-                statements = [stmt.strip()
-                              for stmt in sql_content.split(';') if stmt.strip()]
-
-                try:
-                    for statement in statements:
-                        if statement and not statement.startswith('--'):
-                            conn.execute(text(statement))
+        # Execute new migrations
+        for sql_file in sql_files:
+            if sql_file.name in executed_migrations:
+                print(f"Migration {sql_file.name} already executed, skipping")
+                continue
+
+            try:
+                # One transaction per migration (MySQL still commits DDL
+                # implicitly, but data changes and the history row go together)
+                with engine.begin() as conn:
+                    if record_only:
+                        print(f"Recording migration {sql_file.name} as applied")
+                    else:
+                        print(f"Executing migration: {sql_file.name}")
+                        precheck = MIGRATION_PRECHECKS.get(sql_file.name)
+                        if precheck:
+                            precheck(conn)
+
+                        # Split on statement boundaries, respecting quotes and
+                        # comments, and drop comment-only fragments
+                        for statement in sqlparse.split(sql_file.read_text()):
+                            statement = sqlparse.format(
+                                statement, strip_comments=True).strip()
+                            if statement:
+                                conn.exec_driver_sql(statement)
 
                     # Record successful migration
                     conn.execute(text(
                         "INSERT INTO migration_history (filename) VALUES (:filename)"
-                    ), {"filename": sql_file})
+                    ), {"filename": sql_file.name})
 
-                    conn.commit()
-                    print(f"Migration {sql_file} executed successfully")
+                print(f"Migration {sql_file.name} executed successfully")
 
-                except Exception as e:
-                    conn.rollback()
-                    print(f"Error executing migration {sql_file}: {e}")
-                    raise
+            except Exception as e:
+                print(f"Error executing migration {sql_file.name}: {e}")
+                raise
 
         print("All migrations completed successfully")
 
@@ -151,35 +186,25 @@ def run_sql_migrations(engine):
 def seed_superadmin(engine):
     """Create superadmin user if it doesn't exist"""
     try:
-        SessionLocal = sessionmaker(
-            autocommit=False, autoflush=False, bind=engine)
-        db = SessionLocal()
-
-        # Check if superadmin already exists
-        existing_admin = db.query(User).filter(
-            User.username == "admin").first()
-
-        if not existing_admin:
-            # Create superadmin user
-            admin_password = os.getenv("ADMIN_PASSWORD", "admin123")
-            hashed_password = hash_password(admin_password)
-
-            superadmin = User(
-                username="admin",
-                hashed_password=hashed_password,
-                is_active=True
-            )
-
-            db.add(superadmin)
-            db.commit()
+        admin_password = os.getenv("ADMIN_PASSWORD", "admin123")
+
+        # Single race-free statement keyed on the unique username; an
+        # existing admin is left untouched (affected rows = 0)
+        stmt = mysql_insert(User).prefix_with("IGNORE").values(
+            username="admin",
+            hashed_password=hash_password(admin_password),
+            is_active=True
+        )
+        with engine.begin() as conn:
+            created = conn.execute(stmt).rowcount == 1
+
+        if created:
             print(f"Superadmin user created with username: admin")
             print(f"Default password: {admin_password}")
             print("Please change the default password after first login!")
         else:
             print("Superadmin user already exists")
 
-        db.close()
-
     except Exception as e:
         print(f"Error seeding superadmin: {e}")
         raise
@@ -188,45 +213,50 @@ def seed_superadmin(engine):
 def seed_sample_data(engine):
     """Seed sample data for development"""
     try:
-        SessionLocal = sessionmaker(
-            autocommit=False, autoflush=False, bind=engine)
-        db = SessionLocal()
-
-        # Check if sample data already exists
-        existing_machines = db.query(Machine).count()
-
-        if existing_machines == 0:
-            # Create sample machines with specific data
-            sample_machines = [
-                Machine(
-                    name="Macbook Pro M2",
-                    hostname="scismic.local",
-                    ip_address="192.168.100.72",
-                    mac_address="f6:88:5f:f9:87:69",
-                    ha_entity_id=None,
-                    description=None,
-                    is_active=True
-                ),
-                Machine(
-                    name="3900x",
-                    hostname="JP",
-                    ip_address="192.168.100.10",
-                    mac_address="50-E0-85-8B-4E-4E",
-                    ha_entity_id=None,
-                    description=None,
-                    is_active=True
-                )
-            ]
-
-            for machine in sample_machines:
-                db.add(machine)
-
-            db.commit()
-            print("Sample machines created with specific data")
+        # Create sample machines with specific data
+        sample_machines = [
+            {
+                "name": "Macbook Pro M2",
+                "hostname": "scismic.local",
+                "ip_address": "192.168.100.72",
+                "mac_address": "f6:88:5f:f9:87:69",
+                "ha_entity_id": None,
+                "description": None,
+                "is_active": True
+            },
+            {
+                "name": "3900x",
+                "hostname": "JP",
+                "ip_address": "192.168.100.10",
+                "mac_address": "50-E0-85-8B-4E-4E",
+                "ha_entity_id": None,
+                "description": None,
+                "is_active": True
+            }
+        ]
+
+        # One INSERT ... SELECT: rows are only produced while the table is
+        # empty, so sample machines an operator deleted stay deleted, and a
+        # concurrent start that inserted them first turns this into a no-op
+        # update on the unique hostname
+        columns = list(sample_machines[0])
+        rows = union_all(*(
+            select(*(literal(machine[column]).label(column) for column in columns))
+            for machine in sample_machines
+        )).subquery()
+        stmt = mysql_insert(Machine).from_select(
+            columns,
+            select(*(rows.c[column] for column in columns))
+            .where(~select(Machine.id).exists())
+        )
+        stmt = stmt.on_duplicate_key_update(hostname=Machine.hostname)
+        with engine.begin() as conn:
+            created = conn.execute(stmt).rowcount
+
+        if created:
+            print("Sample machines created")
         else:
-            print("Sample data already exists")
-
-        db.close()
+            print("Machines already exist, skipping sample data")
 
     except Exception as e:
         print(f"Error seeding sample data: {e}")
@@ -1,23 +1,30 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, Response
 import os
 import logging
 import asyncio
 from dotenv import load_dotenv
 
-from .database import engine
+from .database import engine, warm_up_pool
 from . import models
 from .routers import auth_router, machines_router, webhook_router, polling_router
 from .services.glances_poller import start_glances_polling, stop_glances_polling
 from .services.cleanup_service import start_cleanup_service, stop_cleanup_service
+from .services.snapshot_writer import start_snapshot_writer, stop_snapshot_writer
+from .ha_integration import ha_client
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
+# Configure logging; production defaults to WARNING so routine INFO records
+# are dropped before formatting. LOG_LEVEL overrides either default
+LOG_LEVEL = os.getenv(
+    "LOG_LEVEL",
+    "WARNING" if os.getenv("APP_ENV", "").lower() == "production" else "INFO"
+).upper()
 logging.basicConfig(
-    level=logging.INFO,
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.StreamHandler(),
@@ -25,25 +32,34 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+# Schema is managed by `python -m app.init_db`; only create tables here when
+# explicitly asked to, so worker boot skips the metadata round-trips
+if os.getenv("AUTO_CREATE_TABLES", "false").lower() == "true":
+    models.Base.metadata.create_all(bind=engine)
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Machine Hub API",
     description="API for controlling and monitoring machines",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Configure CORS
-origins = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
+origins = list(dict.fromkeys(
+    origin.strip()
+    for origin in os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
+    if origin.strip()
+))
 
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Explicit lists instead of "*": Starlette answers preflights from the
+    # precomputed sets instead of echoing the requested headers back
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type", "X-Secret"],
 )
 
 # Include routers
@@ -58,6 +74,13 @@ app.include_router(polling_router.router,
 
 @app.on_event("startup")
 async def startup_event():
+    # Fill the connection pool before traffic arrives
+    try:
+        await asyncio.to_thread(warm_up_pool)
+    except Exception as e:
+        logger.warning(f"Database pool warm-up failed: {e}")
+    # Start the batched webhook snapshot writer
+    await start_snapshot_writer()
     # Start Glances polling service in background
     asyncio.create_task(start_glances_polling())
     # Start cleanup service
@@ -67,23 +90,36 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("⏹️ Shutting down Machine Hub API")
-    stop_glances_polling()
-    stop_cleanup_service()
+    await stop_glances_polling()
+    await stop_cleanup_service()
+    # Write any webhook snapshots still waiting in the queue
+    await stop_snapshot_writer()
+    await ha_client.aclose()
+
+
+# Pre-encoded bodies; these endpoints are hit by every health probe
+_ROOT_BODY = b'{"message":"Machine Hub API","version":"1.0.0"}'
+_HEALTH_BODY = b'{"status":"healthy"}'
 
 
 @app.get("/")
 async def root():
-    return {"message": "Machine Hub API", "version": "1.0.0"}
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return Response(content=_HEALTH_BODY, media_type="application/json")
+
+
+# Constant 500 body, serialized once
+_INTERNAL_ERROR_BODY = b'{"detail":"Internal server error"}'
 
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
-    return JSONResponse(
+    return Response(
+        content=_INTERNAL_ERROR_BODY,
         status_code=500,
-        content={"detail": "Internal server error"}
+        media_type="application/json"
     )
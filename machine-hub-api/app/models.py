@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .database import Base
@@ -17,10 +17,14 @@ class User(Base):
 
 class Machine(Base):
     __tablename__ = "machines"
+    __table_args__ = (
+        # NULL hostnames are allowed any number of times
+        Index("uq_machines_hostname", "hostname", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
-    hostname = Column(String(255), nullable=False)
+    hostname = Column(String(255), nullable=True)
     ip_address = Column(String(45), nullable=False)  # IPv4/IPv6
     mac_address = Column(String(17), nullable=True)  # For Wake-on-LAN
     # Home Assistant entity ID
@@ -32,7 +36,6 @@ class Machine(Base):
     # System info (moved from SystemSnapshot)
     os_name = Column(String(100), nullable=True)
     os_version = Column(String(100), nullable=True)
-    hostname = Column(String(255), nullable=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -44,6 +47,11 @@ class Machine(Base):
 
 class SystemSnapshot(Base):
     __tablename__ = "system_snapshots"
+    __table_args__ = (
+        # Serves "latest N snapshots per machine" reads as an index range scan
+        # (InnoDB reads it backwards for ORDER BY created_at DESC)
+        Index("ix_snap_machine_created", "machine_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
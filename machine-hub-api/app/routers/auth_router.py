@@ -12,7 +12,7 @@ security = HTTPBearer()
 
 
 @router.post("/login", response_model=schemas.Token)
-async def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
+def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_db)):
     """Authenticate user and return JWT token"""
     user = auth.authenticate_user(
         db, user_credentials.username, user_credentials.password)
@@ -35,7 +35,7 @@ async def login(user_credentials: schemas.UserLogin, db: Session = Depends(get_d
 
 
 @router.post("/register", response_model=schemas.User)
-async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
     # Check if user already exists
     db_user = crud.get_user_by_username(db, username=user.username)
@@ -50,13 +50,13 @@ async def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
 
 
 @router.get("/me", response_model=schemas.User)
-async def read_users_me(current_user=Depends(auth.get_current_active_user)):
+def read_users_me(current_user=Depends(auth.get_current_active_user)):
     """Get current user information"""
     return current_user
 
 
 @router.get("/users", response_model=List[schemas.User])
-async def read_users(
+def read_users(
     skip: int = 0,
     limit: int = 100,
     current_user=Depends(auth.get_current_active_user),
@@ -68,7 +68,7 @@ async def read_users(
 
 
 @router.post("/verify-token")
-async def verify_token(current_user=Depends(auth.get_current_active_user)):
+def verify_token(current_user=Depends(auth.get_current_active_user)):
     """Verify if the current token is valid"""
     return {
         "valid": True,
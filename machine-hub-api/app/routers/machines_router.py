@@ -1,24 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import ORJSONResponse
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from typing import List, Optional
 from datetime import datetime, timedelta
+import asyncio
 import logging
 
 from ..database import get_db
-from .. import crud, schemas, auth
+from .. import crud, models, schemas, auth
 from ..ha_integration import power_on_machine, power_off_machine, get_machine_power_state
 from ..wol import wake_machine
 
-router = APIRouter()
+# Every machine route requires a logged-in user; handlers that need the user
+# object still declare it and get the same cached dependency result
+router = APIRouter(dependencies=[Depends(auth.get_current_active_user)])
 logger = logging.getLogger(__name__)
 
+_MACHINE_FIELDS = tuple(
+    column.key for column in models.Machine.__table__.columns)
+_SNAPSHOT_FIELDS = tuple(
+    column.key for column in models.SystemSnapshot.__table__.columns)
+
+HOSTNAME_TAKEN = "Machine with this hostname already exists"
+
 
 @router.get("/", response_model=List[schemas.Machine])
-async def get_machines(
+def get_machines(
     skip: int = 0,
     limit: int = 100,
     active_only: bool = True,
-    current_user=Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get list of machines"""
@@ -27,45 +39,34 @@ async def get_machines(
     return machines
 
 
-@router.get("/with-snapshots")
-async def get_machines_with_snapshots(
+@router.get("/with-snapshots", response_class=ORJSONResponse)
+def get_machines_with_snapshots(
     skip: int = 0,
     limit: int = 100,
     active_only: bool = True,
-    current_user=Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get machines with their latest system snapshots"""
-    machines_data = crud.get_machines_with_latest_snapshots(
+    rows = crud.get_machines_with_latest_snapshots(
         db, skip=skip, limit=limit, active_only=active_only)
 
+    # Trusted DB output: build plain dicts and let orjson serialize them
+    # directly instead of going through jsonable_encoder
     result = []
-    for item in machines_data:
+    for machine, latest_snapshot in rows:
         machine_dict = {
-            "id": item["machine"].id,
-            "name": item["machine"].name,
-            "hostname": item["machine"].hostname,
-            "ip_address": item["machine"].ip_address,
-            "mac_address": item["machine"].mac_address,
-            "ha_entity_id": item["machine"].ha_entity_id,
-            "description": item["machine"].description,
-            "is_active": item["machine"].is_active,
-            "last_seen": item["machine"].last_seen,
-            "os_name": item["machine"].os_name,
-            "os_version": item["machine"].os_version,
-            "created_at": item["machine"].created_at,
-            "updated_at": item["machine"].updated_at,
-            "latest_snapshot": item["latest_snapshot"]
-        }
+            field: getattr(machine, field) for field in _MACHINE_FIELDS}
+        machine_dict["latest_snapshot"] = {
+            field: getattr(latest_snapshot, field) for field in _SNAPSHOT_FIELDS
+        } if latest_snapshot is not None else None
         result.append(machine_dict)
 
-    return result
+    return ORJSONResponse(result)
 
 
 @router.get("/{machine_id}", response_model=schemas.Machine)
-async def get_machine(
+def get_machine(
     machine_id: int,
-    current_user=Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get a specific machine by ID"""
@@ -76,7 +77,7 @@ async def get_machine(
 
 
 @router.post("/", response_model=schemas.Machine)
-async def create_machine(
+def create_machine(
     machine: schemas.MachineCreate,
     current_user=Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
@@ -85,17 +86,8 @@ async def create_machine(
     logger.info(
         f"User {current_user.username} attempting to add new machine: {machine.name} ({machine.hostname})")
 
-    # Check if machine with same hostname or IP already exists
-    existing_hostname = crud.get_machine_by_hostname(
-        db, hostname=machine.hostname)
-    if existing_hostname:
-        logger.warning(
-            f"Machine creation failed - hostname {machine.hostname} already exists")
-        raise HTTPException(
-            status_code=400,
-            detail="Machine with this hostname already exists"
-        )
-
+    # IP addresses have no unique index, so they are still checked first;
+    # a taken hostname is caught by uq_machines_hostname on insert
     existing_ip = crud.get_machine_by_ip(db, ip_address=machine.ip_address)
     if existing_ip:
         logger.warning(
@@ -105,7 +97,12 @@ async def create_machine(
             detail="Machine with this IP address already exists"
         )
 
-    new_machine = crud.create_machine(db=db, machine=machine)
+    try:
+        new_machine = crud.create_machine(db=db, machine=machine)
+    except IntegrityError:
+        logger.warning(
+            f"Machine creation failed - hostname {machine.hostname} already exists")
+        raise HTTPException(status_code=400, detail=HOSTNAME_TAKEN)
     logger.info(
         f"Successfully added new machine: {new_machine.name} (ID: {new_machine.id}, IP: {new_machine.ip_address}) by user {current_user.username}")
 
@@ -113,24 +110,25 @@ async def create_machine(
 
 
 @router.put("/{machine_id}", response_model=schemas.Machine)
-async def update_machine(
+def update_machine(
     machine_id: int,
     machine_update: schemas.MachineUpdate,
-    current_user=Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Update a machine"""
-    machine = crud.update_machine(
-        db, machine_id=machine_id, machine_update=machine_update)
+    try:
+        machine = crud.update_machine(
+            db, machine_id=machine_id, machine_update=machine_update)
+    except IntegrityError:
+        raise HTTPException(status_code=400, detail=HOSTNAME_TAKEN)
     if machine is None:
         raise HTTPException(status_code=404, detail="Machine not found")
     return machine
 
 
 @router.delete("/{machine_id}")
-async def delete_machine(
+def delete_machine(
     machine_id: int,
-    current_user=Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Delete a machine"""
@@ -140,36 +138,70 @@ async def delete_machine(
     return {"message": "Machine deleted successfully"}
 
 
+async def _run_power_action(machine: models.Machine, action: str) -> dict:
+    """Carry out one power action and return its {'success', 'message'} result"""
+    if action == "on":
+        return await power_on_machine(machine)
+    elif action == "off":
+        return await power_off_machine(machine)
+    elif action == "restart":
+        # First turn off, then turn on after a delay
+        off_result = await power_off_machine(machine)
+        if off_result["success"]:
+            await asyncio.sleep(2)  # Wait 2 seconds without blocking the loop
+            result = await power_on_machine(machine)
+            result["message"] = f"Restart initiated for {machine.name}"
+            return result
+        return off_result
+    elif action == "wake":
+        return wake_machine(machine)
+    raise HTTPException(status_code=400, detail="Invalid power action")
+
+
+@router.post("/power", response_model=List[schemas.MachinePowerResponse])
+async def control_machines_power(
+    power_action: schemas.BulkPowerAction,
+    db: Session = Depends(get_db)
+):
+    """Apply one power action to several machines in a single request"""
+    machine_ids = list(dict.fromkeys(power_action.machine_ids))
+    machines = await run_in_threadpool(crud.get_machines_by_ids, db, machine_ids)
+    by_id = {machine.id: machine for machine in machines}
+
+    # The actions are independent, so run them side by side
+    results = await asyncio.gather(*(
+        _run_power_action(by_id[machine_id], power_action.action)
+        for machine_id in machine_ids if machine_id in by_id
+    ))
+    found = iter(results)
+
+    responses = []
+    for machine_id in machine_ids:
+        if machine_id in by_id:
+            result = next(found)
+        else:
+            result = {"success": False, "message": "Machine not found"}
+        responses.append(schemas.MachinePowerResponse(
+            machine_id=machine_id,
+            success=result["success"],
+            message=result["message"],
+            action=power_action.action
+        ))
+    return responses
+
+
 @router.post("/{machine_id}/power", response_model=schemas.PowerResponse)
 async def control_machine_power(
     machine_id: int,
     power_action: schemas.PowerAction,
-    current_user=Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Control machine power (on/off/restart)"""
-    machine = crud.get_machine(db, machine_id=machine_id)
+    machine = await run_in_threadpool(crud.get_machine, db, machine_id=machine_id)
     if machine is None:
         raise HTTPException(status_code=404, detail="Machine not found")
 
-    if power_action.action == "on":
-        result = power_on_machine(machine)
-    elif power_action.action == "off":
-        result = power_off_machine(machine)
-    elif power_action.action == "restart":
-        # First turn off, then turn on after a delay
-        off_result = power_off_machine(machine)
-        if off_result["success"]:
-            import time
-            time.sleep(2)  # Wait 2 seconds
-            result = power_on_machine(machine)
-            result["message"] = f"Restart initiated for {machine.name}"
-        else:
-            result = off_result
-    elif power_action.action == "wake":
-        result = wake_machine(machine)
-    else:
-        raise HTTPException(status_code=400, detail="Invalid power action")
+    result = await _run_power_action(machine, power_action.action)
 
     return schemas.PowerResponse(
         success=result["success"],
@@ -181,56 +213,57 @@ async def control_machine_power(
 @router.get("/{machine_id}/power-state")
 async def get_machine_power_state_endpoint(
     machine_id: int,
-    current_user=Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get current power state of a machine"""
-    machine = crud.get_machine(db, machine_id=machine_id)
+    machine = await run_in_threadpool(crud.get_machine, db, machine_id=machine_id)
     if machine is None:
         raise HTTPException(status_code=404, detail="Machine not found")
 
-    result = get_machine_power_state(machine)
+    result = await get_machine_power_state(machine)
     return result
 
 
-@router.get("/{machine_id}/snapshots", response_model=List[schemas.SystemSnapshot])
-async def get_machine_snapshots(
+# The rows bypass response_model validation; the declared model (payload
+# fields optional) documents both shapes
+@router.get("/{machine_id}/snapshots", response_model=List[schemas.SystemSnapshot], response_class=ORJSONResponse)
+def get_machine_snapshots(
     machine_id: int,
     limit: int = Query(default=100, le=1000),
-    current_user=Depends(auth.get_current_active_user),
+    include_payload: bool = Query(default=False),
     db: Session = Depends(get_db)
 ):
-    """Get system snapshots for a machine"""
+    """Get system snapshots for a machine (JSON payloads with include_payload)"""
     machine = crud.get_machine(db, machine_id=machine_id)
     if machine is None:
         raise HTTPException(status_code=404, detail="Machine not found")
 
-    snapshots = crud.get_machine_snapshots(
-        db, machine_id=machine_id, limit=limit)
-    return snapshots
+    rows = crud.get_machine_snapshots(
+        db, machine_id=machine_id, limit=limit, include_payload=include_payload)
+    return ORJSONResponse([dict(row._mapping) for row in rows])
 
 
-@router.get("/{machine_id}/snapshots/latest", response_model=Optional[schemas.SystemSnapshot])
-async def get_latest_machine_snapshot(
+@router.get("/{machine_id}/snapshots/latest", response_model=Optional[schemas.SystemSnapshot], response_class=ORJSONResponse)
+def get_latest_machine_snapshot(
     machine_id: int,
-    current_user=Depends(auth.get_current_active_user),
+    include_payload: bool = Query(default=True),
     db: Session = Depends(get_db)
 ):
-    """Get the latest system snapshot for a machine"""
+    """Get the latest system snapshot for a machine (include_payload=false skips the JSON payloads)"""
     machine = crud.get_machine(db, machine_id=machine_id)
     if machine is None:
         raise HTTPException(status_code=404, detail="Machine not found")
 
-    snapshot = crud.get_latest_snapshot(db, machine_id=machine_id)
-    return snapshot
+    row = crud.get_latest_snapshot(
+        db, machine_id=machine_id, include_payload=include_payload)
+    return ORJSONResponse(dict(row._mapping) if row is not None else None)
 
 
-@router.get("/{machine_id}/snapshots/timerange", response_model=List[schemas.SystemSnapshot])
-async def get_machine_snapshots_timerange(
+@router.get("/{machine_id}/snapshots/timerange", response_model=List[schemas.SystemSnapshotSummary])
+def get_machine_snapshots_timerange(
     machine_id: int,
     start_time: datetime,
     end_time: datetime,
-    current_user=Depends(auth.get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get system snapshots for a machine within a time range"""
@@ -241,3 +274,16 @@ async def get_machine_snapshots_timerange(
     snapshots = crud.get_snapshots_in_timerange(
         db, machine_id=machine_id, start_time=start_time, end_time=end_time)
     return snapshots
+
+
+@router.get("/{machine_id}/snapshots/{snapshot_id}", response_model=schemas.SystemSnapshot)
+def get_machine_snapshot_detail(
+    machine_id: int,
+    snapshot_id: int,
+    db: Session = Depends(get_db)
+):
+    """Get a single system snapshot including sensor/alert/network/filesystem data"""
+    snapshot = crud.get_snapshot_detail(db, snapshot_id=snapshot_id)
+    if snapshot is None or snapshot.machine_id != machine_id:
+        raise HTTPException(status_code=404, detail="Snapshot not found")
+    return snapshot
@@ -1,10 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, Header
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, HTTPException, Header
 from typing import Optional
 import asyncio
 import logging
 
-from ..database import get_db
 from ..auth import verify_api_key
 from ..services.glances_poller import glances_poller
 from .. import schemas
@@ -15,8 +13,7 @@ logger = logging.getLogger(__name__)
 
 @router.post("/trigger-collection")
 async def trigger_data_collection(
-    x_secret: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    x_secret: Optional[str] = Header(None)
 ):
     """
     Manually trigger data collection from all active machines
@@ -43,8 +40,7 @@ async def trigger_data_collection(
 
 @router.get("/polling-status")
 async def get_polling_status(
-    x_secret: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    x_secret: Optional[str] = Header(None)
 ):
     """
     Get the current status of the polling service
@@ -61,8 +57,7 @@ async def get_polling_status(
 
 @router.post("/start-polling")
 async def start_polling(
-    x_secret: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    x_secret: Optional[str] = Header(None)
 ):
     """
     Start the polling service if it's not running
@@ -94,8 +89,7 @@ async def start_polling(
 
 @router.post("/stop-polling")
 async def stop_polling(
-    x_secret: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+    x_secret: Optional[str] = Header(None)
 ):
     """
     Stop the polling service
@@ -108,7 +102,7 @@ async def stop_polling(
         )
 
     try:
-        glances_poller.stop_polling()
+        await glances_poller.stop_polling()
 
         return schemas.APIResponse(
             success=True,
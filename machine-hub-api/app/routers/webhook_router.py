@@ -1,31 +1,82 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Header, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
-from typing import Optional, Dict, Any
-import json
+from starlette.concurrency import run_in_threadpool
+from typing import Optional, Dict, Any, List, Tuple
+import orjson
 import logging
 import os
-from datetime import datetime
+import re
+from datetime import datetime, timedelta
 
-from ..database import get_db
+from ..database import SessionLocal, get_db
 from .. import crud, schemas
-from ..auth import verify_api_key
+from ..auth import require_api_key
+from ..services.snapshot_writer import snapshot_writer
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+# Uptime string parts, e.g. "30 days, 17:37:37"
+_UPTIME_DAYS = re.compile(r'(\d+)\s+days?')
+_UPTIME_HMS = re.compile(r'(\d+):(\d+):(\d+)')
+
+# Parsed Glances keys that map onto SystemSnapshot columns
+SNAPSHOT_FIELDS = frozenset({
+    "cpu_percent", "memory_percent", "memory_used", "memory_total",
+    "uptime", "load_avg",
+    "cpu_user", "cpu_system", "cpu_iowait", "cpu_count",
+    "swap_percent", "swap_used", "swap_total", "swap_free",
+    "battery_percent", "battery_status",
+    "sensors_data", "alert_data", "network_data", "fs_data",
+})
+
+
+# Bytes -> GB as a multiply by a precomputed reciprocal
+_INV_GIB = 1.0 / 1073741824
+
+
+def _bytes_to_gb(value) -> float:
+    return float(value) * _INV_GIB
+
+
+# (section, source key, parsed key, transform) for the flat Glances fields
+_FIELD_MAP = (
+    ("cpu", "total", "cpu_percent", None),
+    ("cpu", "user", "cpu_user", None),
+    ("cpu", "system", "cpu_system", None),
+    ("cpu", "iowait", "cpu_iowait", None),
+    ("mem", "percent", "memory_percent", None),
+    ("mem", "used", "memory_used", _bytes_to_gb),
+    ("mem", "total", "memory_total", _bytes_to_gb),
+    ("memswap", "percent", "swap_percent", None),
+    ("memswap", "used", "swap_used", _bytes_to_gb),
+    ("memswap", "total", "swap_total", _bytes_to_gb),
+    ("memswap", "free", "swap_free", _bytes_to_gb),
+    ("load", "min1", "load_avg", None),  # 1-minute load average
+    ("system", "os_name", "os_name", None),
+    ("system", "os_version", "os_version", None),
+)
+
+
+_LOG_ENABLED = os.getenv('APP_ENV', '').lower() != 'production'
+
+# Most samples one /glances/batch request may carry
+MAX_BATCH_SAMPLES = 500
+
+
 def should_log():
     """Check if logging should be enabled based on environment"""
-    return os.getenv('APP_ENV', '').lower() != 'production'
+    return _LOG_ENABLED
 
 
 def parse_glances_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """Parse Glances data and extract relevant metrics"""
-    # Extract hostname from system data or fallback to root level
-    hostname = "unknown"
+    # Extract hostname from system data or fallback to root level; None
+    # when neither has one (machines.hostname is unique)
     if "system" in data and isinstance(data["system"], dict):
-        hostname = data["system"].get("hostname", "unknown")
+        hostname = data["system"].get("hostname")
     else:
-        hostname = data.get("hostname", "unknown")
+        hostname = data.get("hostname")
 
     parsed = {
         "hostname": hostname,
@@ -56,52 +107,33 @@ def parse_glances_data(data: Dict[str, Any]) -> Dict[str, Any]:
         "fs_data": None
     }
 
-    # Parse CPU data
-    if "cpu" in data and isinstance(data["cpu"], dict):
-        cpu_data = data["cpu"]
-        parsed["cpu_percent"] = cpu_data.get("total")
-        parsed["cpu_user"] = cpu_data.get("user")
-        parsed["cpu_system"] = cpu_data.get("system")
-        parsed["cpu_iowait"] = cpu_data.get("iowait")
-        if "cpucore" in cpu_data and isinstance(cpu_data["cpucore"], (list, dict)):
-            parsed["cpu_count"] = len(cpu_data["cpucore"])
-        elif "cpucore" in cpu_data and isinstance(cpu_data["cpucore"], int):
-            parsed["cpu_count"] = cpu_data["cpucore"]
-
-    # Parse memory data
-    if "mem" in data and isinstance(data["mem"], dict):
-        mem_data = data["mem"]
-        parsed["memory_percent"] = mem_data.get("percent")
-        if "used" in mem_data:
-            parsed["memory_used"] = mem_data["used"] / \
-                (1024**3)  # Convert to GB
-        if "total" in mem_data:
-            parsed["memory_total"] = mem_data["total"] / \
-                (1024**3)  # Convert to GB
-
-    # Parse memory swap data
-    if "memswap" in data and isinstance(data["memswap"], dict):
-        swap_data = data["memswap"]
-        parsed["swap_percent"] = swap_data.get("percent")
-        if "used" in swap_data:
-            parsed["swap_used"] = float(
-                swap_data["used"]) / (1024**3)  # Convert to GB
-        if "total" in swap_data:
-            parsed["swap_total"] = float(
-                swap_data["total"]) / (1024**3)  # Convert to GB
-        if "free" in swap_data:
-            parsed["swap_free"] = float(
-                swap_data["free"]) / (1024**3)  # Convert to GB
+    # Flat section fields, driven by _FIELD_MAP
+    for section_name, src_key, dst_key, transform in _FIELD_MAP:
+        section = data.get(section_name)
+        if isinstance(section, dict):
+            value = section.get(src_key)
+            parsed[dst_key] = transform(value) if transform and value is not None else value
+
+    # CPU core count may be a list/dict of cores or a plain number
+    cpu_data = data.get("cpu")
+    if isinstance(cpu_data, dict):
+        cpucore = cpu_data.get("cpucore")
+        if isinstance(cpucore, (list, dict)):
+            parsed["cpu_count"] = len(cpucore)
+        elif isinstance(cpucore, int):
+            parsed["cpu_count"] = cpucore
 
     # Parse uptime (convert to seconds if it's a string)
     uptime_raw = data.get('uptime', 0)
-    if isinstance(uptime_raw, str):
+    if isinstance(uptime_raw, (int, float)):
+        # Already in seconds
+        parsed["uptime"] = int(uptime_raw)
+    elif isinstance(uptime_raw, str):
         # Parse uptime string like "30 days, 17:37:37" to seconds
         try:
-            import re
             # Extract days, hours, minutes, seconds
-            days_match = re.search(r'(\d+)\s+days?', uptime_raw)
-            time_match = re.search(r'(\d+):(\d+):(\d+)', uptime_raw)
+            days_match = _UPTIME_DAYS.search(uptime_raw)
+            time_match = _UPTIME_HMS.search(uptime_raw)
 
             days = int(days_match.group(1)) if days_match else 0
             hours = int(time_match.group(1)) if time_match else 0
@@ -117,16 +149,6 @@ def parse_glances_data(data: Dict[str, Any]) -> Dict[str, Any]:
     else:
         parsed["uptime"] = int(uptime_raw) if uptime_raw else 0
 
-    # Parse load average
-    if "load" in data and isinstance(data["load"], dict):
-        parsed["load_avg"] = data["load"].get("min1")  # 1-minute load average
-
-    # Parse system info
-    if "system" in data and isinstance(data["system"], dict):
-        system_data = data["system"]
-        parsed["os_name"] = system_data.get("os_name")
-        parsed["os_version"] = system_data.get("os_version")
-
     # Parse battery data
     if "sensors" in data and isinstance(data["sensors"], list):
         for sensor in data["sensors"]:
@@ -140,20 +162,13 @@ def parse_glances_data(data: Dict[str, Any]) -> Dict[str, Any]:
     if "fs" in data and isinstance(data["fs"], list):
         parsed["fs_data"] = data["fs"]
 
-    # Store complete JSON data structures
+    # Store complete JSON data structures, including string values
+    # (like "Not available")
     if "sensors" in data:
-        if isinstance(data["sensors"], list):
-            parsed["sensors_data"] = data["sensors"]
-        else:
-            # Store string values (like "Not available") as well
-            parsed["sensors_data"] = data["sensors"]
+        parsed["sensors_data"] = data["sensors"]
 
     if "alert" in data:
-        if isinstance(data["alert"], list):
-            parsed["alert_data"] = data["alert"]
-        else:
-            # Store string values (like "Not available") as well
-            parsed["alert_data"] = data["alert"]
+        parsed["alert_data"] = data["alert"]
 
     if "network" in data and isinstance(data["network"], list):
         parsed["network_data"] = data["network"]
@@ -161,30 +176,12 @@ def parse_glances_data(data: Dict[str, Any]) -> Dict[str, Any]:
     return parsed
 
 
-@router.post("/glances")
-async def receive_glances_data(
-    request: Request,
-    x_secret: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
-):
-    """Receive system metrics data from Glances"""
-
-    # Verify API key if configured
-    if not verify_api_key(x_secret):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or missing API key"
-        )
-
-    # Parse the request body
-    try:
-        raw_data = await request.json()
-    except json.JSONDecodeError:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid JSON in request body"
-        )
+def prepare_glances_snapshot(db: Session, raw_data: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[schemas.SystemSnapshotDict]]:
+    """Authorize the reporting machine by IP and build its snapshot values
 
+    Returns the response body and the SystemSnapshot column values to queue
+    (None when there is nothing to store).
+    """
     # Get client IPs from payload
     external_ip = raw_data.get('external_ip')
     local_ip = raw_data.get('local_ip')
@@ -199,15 +196,7 @@ async def receive_glances_data(
         )
 
     # Check if any of the client IPs are registered in machines table
-    allowed_machine = None
-    matched_ip = None
-
-    for ip in ips_to_check:
-        machine = crud.get_machine_by_ip(db, ip_address=ip)
-        if machine:
-            allowed_machine = machine
-            matched_ip = ip
-            break
+    allowed_machine = crud.get_machine_ref_by_any_ip(db, ips_to_check)
 
     if not allowed_machine:
         if should_log():
@@ -219,7 +208,7 @@ async def receive_glances_data(
         )
 
     # Use the matched IP for logging
-    client_ip = matched_ip
+    client_ip = allowed_machine.ip_address
 
     try:
 
@@ -228,7 +217,8 @@ async def receive_glances_data(
         hostname = parsed_data["hostname"]
 
         # Find machine by hostname
-        machine = crud.get_machine_by_hostname(db, hostname=hostname)
+        machine = crud.get_machine_ref_by_hostname(
+            db, hostname=hostname) if hostname else None
         if not machine:
             # Use the IP-validated machine if hostname doesn't match
             machine = allowed_machine
@@ -241,68 +231,25 @@ async def receive_glances_data(
                 "success": False,
                 "message": f"Machine not found: {hostname}",
                 "hostname": hostname
-            }
-
-        # Update machine system info if empty or different
-        machine_updated = False
-        os_name = parsed_data.get("os_name")
-        os_version = parsed_data.get("os_version")
-        hostname = parsed_data.get("hostname")
-
-        if os_name and (not machine.os_name or machine.os_name != os_name):
-            machine.os_name = os_name
-            machine_updated = True
-
-        if os_version and (not machine.os_version or machine.os_version != os_version):
-            machine.os_version = os_version
-            machine_updated = True
-
-        if hostname and (not machine.hostname or machine.hostname != hostname):
-            machine.hostname = hostname
-            machine_updated = True
-
-        if machine_updated:
-            db.commit()
-            db.refresh(machine)
-
-        # Create snapshot record with all metrics
-        snapshot_data = schemas.SystemSnapshotCreate(
-            machine_id=machine.id,
-            cpu_percent=parsed_data.get("cpu_percent"),
-            memory_percent=parsed_data.get("memory_percent"),
-            memory_used=parsed_data.get("memory_used"),
-            memory_total=parsed_data.get("memory_total"),
-
-            uptime=parsed_data.get("uptime"),
-            load_avg=parsed_data.get("load_avg"),
-            # Additional CPU metrics
-            cpu_user=parsed_data.get("cpu_user"),
-            cpu_system=parsed_data.get("cpu_system"),
-            cpu_iowait=parsed_data.get("cpu_iowait"),
-            cpu_count=parsed_data.get("cpu_count"),
-            # Memory swap metrics
-            swap_percent=parsed_data.get("swap_percent"),
-            swap_used=parsed_data.get("swap_used"),
-            swap_total=parsed_data.get("swap_total"),
-            swap_free=parsed_data.get("swap_free"),
-
-            # Battery metrics
-            battery_percent=parsed_data.get("battery_percent"),
-            battery_status=parsed_data.get("battery_status"),
-            # JSON data structures
-            sensors_data=parsed_data.get("sensors_data"),
-            alert_data=parsed_data.get("alert_data"),
-            network_data=parsed_data.get("network_data"),
-            fs_data=parsed_data.get("fs_data"),
-            # Source identifier
-            source="webhook"
-        )
-
-        # Store in database
-        snapshot = crud.create_system_snapshot(db, snapshot_data)
+            }, None
+
+        # Update machine system info if empty or different. The cached row
+        # short-circuits the steady state; the guarded UPDATE re-checks
+        # server-side and commits only a real change
+        system_info = {
+            field: parsed_data[field]
+            for field in ("os_name", "os_version", "hostname")
+            if parsed_data.get(field) and getattr(machine, field) != parsed_data[field]
+        }
+        if system_info:
+            crud.update_machine_system_info(db, machine.id, system_info)
 
-        # Update last_seen timestamp
-        crud.update_machine_last_seen(db, machine.id)
+        # Snapshot column values straight from the parsed dict; the snapshot
+        # writer stores them (and stamps last_seen) in its next batch
+        snapshot: schemas.SystemSnapshotDict = {
+            field: parsed_data.get(field) for field in SNAPSHOT_FIELDS}
+        snapshot["machine_id"] = machine.id
+        snapshot["source"] = "webhook"
 
         if should_log():
             logger.info(
@@ -310,17 +257,11 @@ async def receive_glances_data(
 
         return {
             "success": True,
-            "message": "Data received and stored successfully",
+            "message": "Data received and queued for storage",
             "machine_id": machine.id,
-            "machine_name": machine.name,
-            "snapshot_id": snapshot.id
-        }
+            "machine_name": machine.name
+        }, snapshot
 
-    except json.JSONDecodeError:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid JSON data"
-        )
     except Exception as e:
         if should_log():
             logger.error(f"Error processing Glances webhook: {e}")
@@ -330,6 +271,115 @@ async def receive_glances_data(
         )
 
 
+@router.post("/glances", status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(require_api_key)])
+async def receive_glances_data(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Receive system metrics data from Glances"""
+
+    # Parse the request body
+    try:
+        raw_data = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid JSON in request body"
+        )
+
+    # Machine lookups are blocking database calls; run them in the threadpool
+    # instead of on the event loop
+    result, snapshot = await run_in_threadpool(
+        prepare_glances_snapshot, db, raw_data)
+
+    # Persistence is batched in the background, hence 202 Accepted
+    if snapshot is not None:
+        await snapshot_writer.enqueue(snapshot)
+    return result
+
+
+def prepare_glances_batch(db: Session, samples: List[Any]) -> Tuple[List[Dict[str, Any]], List[schemas.SystemSnapshotDict]]:
+    """Build snapshots for a list of buffered Glances samples
+
+    Each sample may carry age_seconds (how long the sender buffered it) so
+    it is stored with the time it was collected rather than received.
+    """
+    results = []
+    snapshots = []
+    received_at = datetime.utcnow()
+
+    for raw_data in samples:
+        if not isinstance(raw_data, dict):
+            results.append({"success": False, "message": "Invalid sample"})
+            continue
+        try:
+            result, snapshot = prepare_glances_snapshot(db, raw_data)
+        except HTTPException as e:
+            results.append({"success": False, "message": e.detail})
+            continue
+
+        results.append(result)
+        if snapshot is not None:
+            age_seconds = raw_data.get("age_seconds")
+            if isinstance(age_seconds, (int, float)) and age_seconds > 0:
+                snapshot["created_at"] = received_at - \
+                    timedelta(seconds=age_seconds)
+            snapshots.append(snapshot)
+
+    return results, snapshots
+
+
+@router.post("/glances/batch", status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(require_api_key)])
+async def receive_glances_batch(
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Receive several buffered Glances samples in one request"""
+
+    # Parse the request body: {"snapshots": [<glances sample>, ...]}
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid JSON in request body"
+        )
+
+    samples = body.get("snapshots") if isinstance(body, dict) else None
+    if not isinstance(samples, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Expected a JSON object with a 'snapshots' list"
+        )
+    if len(samples) > MAX_BATCH_SAMPLES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_BATCH_SAMPLES} samples per batch"
+        )
+
+    results, snapshots = await run_in_threadpool(
+        prepare_glances_batch, db, samples)
+    if not snapshots:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={
+                "message": f"None of the {len(samples)} samples could be stored",
+                "results": results
+            }
+        )
+
+    for snapshot in snapshots:
+        await snapshot_writer.enqueue(snapshot)
+    return {
+        "success": True,
+        "message": f"{len(snapshots)} of {len(samples)} samples queued for storage",
+        "queued": len(snapshots),
+        "results": results
+    }
+
+
 @router.get("/glances/test")
 async def test_glances_webhook():
     """Test endpoint for Glances webhook"""
@@ -340,69 +390,57 @@ async def test_glances_webhook():
     }
 
 
-@router.post("/cleanup-snapshots")
-async def cleanup_old_snapshots(
-    days_to_keep: int = 30,
-    x_secret: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
-):
-    """Clean up old system snapshots by age (admin endpoint)"""
-
-    # Verify API key
-    if not verify_api_key(x_secret):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or missing API key"
-        )
-
+def run_snapshot_cleanup(cleanup, **kwargs):
+    """Run a crud cleanup function on its own session after the response"""
+    db = SessionLocal()
     try:
-        deleted_count = crud.cleanup_old_snapshots(
-            db, days_to_keep=days_to_keep)
-        return {
-            "success": True,
-            "message": f"Cleaned up {deleted_count} old snapshots",
-            "deleted_count": deleted_count,
-            "days_kept": days_to_keep,
-            "cleanup_method": "by_age"
-        }
+        deleted_count = cleanup(db, **kwargs)
+        if should_log():
+            logger.info(
+                f"🧹 {cleanup.__name__} removed {deleted_count} snapshots ({kwargs})")
     except Exception as e:
         if should_log():
             logger.error(f"Error cleaning up snapshots: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error cleaning up snapshots"
-        )
+        db.rollback()
+    finally:
+        db.close()
 
 
-@router.post("/cleanup-snapshots-by-count")
-async def cleanup_snapshots_by_count(
-    max_records_per_machine: int = 10000,
-    x_secret: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
+@router.post("/cleanup-snapshots", status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(require_api_key)])
+def cleanup_old_snapshots(
+    background_tasks: BackgroundTasks,
+    days_to_keep: int = 30
 ):
-    """Keep only the latest N records per machine, delete older ones (admin endpoint)"""
+    """Schedule cleanup of old system snapshots by age (admin endpoint)"""
 
-    # Verify API key
-    if not verify_api_key(x_secret):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid or missing API key"
-        )
+    # Batched deletes can run for minutes on a large table; do them after
+    # the response instead of holding the request open
+    background_tasks.add_task(
+        run_snapshot_cleanup, crud.cleanup_old_snapshots,
+        days_to_keep=days_to_keep, batch_size=10000)
+    return {
+        "success": True,
+        "message": f"Cleanup of snapshots older than {days_to_keep} days scheduled",
+        "days_kept": days_to_keep,
+        "cleanup_method": "by_age"
+    }
 
-    try:
-        deleted_count = crud.cleanup_snapshots_by_count(
-            db, max_records_per_machine=max_records_per_machine)
-        return {
-            "success": True,
-            "message": f"Cleaned up {deleted_count} old snapshots, keeping latest {max_records_per_machine} per machine",
-            "deleted_count": deleted_count,
-            "max_records_per_machine": max_records_per_machine,
-            "cleanup_method": "by_count"
-        }
-    except Exception as e:
-        if should_log():
-            logger.error(f"Error cleaning up snapshots by count: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="Error cleaning up snapshots"
-        )
+
+@router.post("/cleanup-snapshots-by-count", status_code=status.HTTP_202_ACCEPTED,
+             dependencies=[Depends(require_api_key)])
+def cleanup_snapshots_by_count(
+    background_tasks: BackgroundTasks,
+    max_records_per_machine: int = 10000
+):
+    """Schedule keeping only the latest N records per machine (admin endpoint)"""
+
+    background_tasks.add_task(
+        run_snapshot_cleanup, crud.cleanup_snapshots_by_count,
+        max_records_per_machine=max_records_per_machine)
+    return {
+        "success": True,
+        "message": f"Cleanup scheduled, keeping latest {max_records_per_machine} snapshots per machine",
+        "max_records_per_machine": max_records_per_machine,
+        "cleanup_method": "by_count"
+    }
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, TypedDict
 from datetime import datetime
 
 # User schemas
@@ -84,7 +84,7 @@ class Machine(MachineBase):
 # System snapshot schemas
 
 
-class SystemSnapshotBase(BaseModel):
+class SystemSnapshotMetrics(BaseModel):
     cpu_percent: Optional[float] = None
     memory_percent: Optional[float] = None
     memory_used: Optional[float] = None
@@ -111,20 +111,53 @@ class SystemSnapshotBase(BaseModel):
     battery_percent: Optional[float] = None
     battery_status: Optional[str] = None
 
+    # Source of the data
+    source: Optional[str] = Field(default="api", max_length=20)
+
+
+class SystemSnapshotBase(SystemSnapshotMetrics):
     # JSON data structures
     sensors_data: Optional[List[Dict]] = None  # Complete sensors array
     alert_data: Optional[List[Dict]] = None  # Complete alert array
     network_data: Optional[List[Dict]] = None  # Complete network array
     fs_data: Optional[List[Dict]] = None  # Complete filesystem array
 
-    # Source of the data
-    source: Optional[str] = Field(default="api", max_length=20)
-
 
 class SystemSnapshotCreate(SystemSnapshotBase):
     machine_id: int
 
 
+class SystemSnapshotDict(TypedDict, total=False):
+    """SystemSnapshot column values as produced by our own Glances parsers.
+
+    Used on the poller/webhook write path in place of SystemSnapshotCreate:
+    the values are already typed by the parser, so there is nothing for
+    Pydantic to validate.
+    """
+    machine_id: int
+    source: str
+    cpu_percent: Optional[float]
+    memory_percent: Optional[float]
+    memory_used: Optional[float]
+    memory_total: Optional[float]
+    uptime: Optional[int]
+    load_avg: Optional[float]
+    cpu_user: Optional[float]
+    cpu_system: Optional[float]
+    cpu_iowait: Optional[float]
+    cpu_count: Optional[int]
+    swap_percent: Optional[float]
+    swap_used: Optional[float]
+    swap_total: Optional[float]
+    swap_free: Optional[float]
+    battery_percent: Optional[float]
+    battery_status: Optional[str]
+    sensors_data: Any
+    alert_data: Any
+    network_data: Any
+    fs_data: Any
+
+
 class SystemSnapshot(SystemSnapshotBase):
     id: int
     machine_id: int
@@ -134,6 +167,16 @@ class SystemSnapshot(SystemSnapshotBase):
     class Config:
         from_attributes = True
 
+
+class SystemSnapshotSummary(SystemSnapshotMetrics):
+    """Scalar metrics only, for snapshot history lists"""
+    id: int
+    machine_id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
 # Machine with latest snapshot
 
 
@@ -152,6 +195,15 @@ class PowerResponse(BaseModel):
     message: str
     action: str
 
+
+class BulkPowerAction(PowerAction):
+    # Every id becomes a concurrent power action, so keep requests bounded
+    machine_ids: List[int] = Field(..., min_length=1, max_length=100)
+
+
+class MachinePowerResponse(PowerResponse):
+    machine_id: int
+
 # Glances webhook schemas
 
 
@@ -9,19 +9,22 @@ This service automatically maintains the database by keeping only the latest
 import asyncio
 import logging
 import os
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from sqlalchemy.orm import sessionmaker
-from ..database import engine
+from ..database import SessionLocal
 from .. import crud
 
 logger = logging.getLogger(__name__)
 
 
+# Read once; APP_ENV is fixed for the life of the process
+_LOG_ENABLED = os.getenv('APP_ENV', '').lower() != 'production'
+
+
 def should_log():
     """Check if logging should be enabled based on environment"""
-    return os.getenv('APP_ENV', '').lower() != 'production'
+    return _LOG_ENABLED
 
 
 class CleanupService:
@@ -30,7 +33,8 @@ class CleanupService:
     def __init__(self,
                  max_records_per_machine: int = 10000,
                  cleanup_interval_hours: int = 6,
-                 cleanup_old_records_days: Optional[int] = None):
+                 cleanup_old_records_days: Optional[int] = None,
+                 cleanup_chunk_size: int = 5000):
         """
         Initialize cleanup service
 
@@ -38,16 +42,20 @@ class CleanupService:
             max_records_per_machine: Maximum number of records to keep per machine
             cleanup_interval_hours: How often to run cleanup (in hours)
             cleanup_old_records_days: If set, also cleanup records older than N days
+            cleanup_chunk_size: Maximum rows removed per DELETE statement
         """
         self.max_records_per_machine = max_records_per_machine
         self.cleanup_interval_hours = cleanup_interval_hours
+        self._interval_seconds = cleanup_interval_hours * 3600
         self.cleanup_old_records_days = cleanup_old_records_days
+        self.cleanup_chunk_size = cleanup_chunk_size
         self.is_running = False
         self.task: Optional[asyncio.Task] = None
+        # Set by stop() to end the wait between cleanup runs immediately
+        self._stop_event = asyncio.Event()
 
-        # Create database session factory
-        self.SessionLocal = sessionmaker(
-            autocommit=False, autoflush=False, bind=engine)
+        # Database session factory
+        self.SessionLocal = SessionLocal
 
     async def start(self):
         """Start the cleanup service"""
@@ -57,15 +65,16 @@ class CleanupService:
             return
 
         self.is_running = True
+        self._stop_event.clear()
         self.task = asyncio.create_task(self._cleanup_loop())
         if should_log():
             logger.info(
-                f"🧹 Cleanup service started - will run every {self.cleanup_interval_hours} hours")
+                "🧹 Cleanup service started - will run every %s hours", self.cleanup_interval_hours)
             logger.info(
-                f"📊 Keeping latest {self.max_records_per_machine} records per machine")
+                "📊 Keeping latest %s records per machine", self.max_records_per_machine)
             if self.cleanup_old_records_days:
                 logger.info(
-                    f"🗓️ Also removing records older than {self.cleanup_old_records_days} days")
+                    "🗓️ Also removing records older than %s days", self.cleanup_old_records_days)
 
     async def stop(self):
         """Stop the cleanup service"""
@@ -73,25 +82,39 @@ class CleanupService:
             return
 
         self.is_running = False
+        self._stop_event.set()
         if self.task:
-            self.task.cancel()
+            # The loop exits on its own once the event is set; cancel only if
+            # a cleanup run is still going after a short grace period
             try:
-                await self.task
+                await asyncio.wait_for(self.task, timeout=5)
+            except asyncio.TimeoutError:
+                pass
             except asyncio.CancelledError:
                 pass
 
         if should_log():
             logger.info("🛑 Cleanup service stopped")
 
+    async def _wait_or_stop(self, seconds: float) -> bool:
+        """Wait up to `seconds`; return True if stop() was called meanwhile"""
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=seconds)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
     async def _cleanup_loop(self):
         """Main cleanup loop"""
         while self.is_running:
             try:
-                await self._run_cleanup()
+                # Deletes can run for a while; keep them off the event loop
+                await asyncio.to_thread(self._run_cleanup)
 
-                # Wait for next cleanup interval
-                # Convert hours to seconds
-                await asyncio.sleep(self.cleanup_interval_hours * 3600)
+                # Wait for next cleanup interval (hours to seconds), or until
+                # the service is stopped
+                if await self._wait_or_stop(self._interval_seconds):
+                    break
 
             except asyncio.CancelledError:
                 if should_log():
@@ -99,11 +122,12 @@ class CleanupService:
                 break
             except Exception as e:
                 if should_log():
-                    logger.error(f"Error in cleanup loop: {e}")
+                    logger.error("Error in cleanup loop: %s", e)
                 # Wait a bit before retrying on error
-                await asyncio.sleep(300)  # 5 minutes
+                if await self._wait_or_stop(300):  # 5 minutes
+                    break
 
-    async def _run_cleanup(self):
+    def _run_cleanup(self):
         """Run the actual cleanup operations"""
         if should_log():
             logger.info("🧹 Starting database cleanup...")
@@ -112,26 +136,31 @@ class CleanupService:
         try:
             total_deleted = 0
 
-            # Cleanup by count (keep latest N records per machine)
+            # Cleanup by count (keep latest N records per machine), in
+            # committed chunks so ingestion is never blocked for long
             deleted_by_count = crud.cleanup_snapshots_by_count(
-                db, max_records_per_machine=self.max_records_per_machine
+                db, max_records_per_machine=self.max_records_per_machine,
+                chunk_size=self.cleanup_chunk_size
             )
             total_deleted += deleted_by_count
 
             if deleted_by_count > 0 and should_log():
                 logger.info(
-                    f"📊 Deleted {deleted_by_count} records to maintain {self.max_records_per_machine} records per machine")
+                    "📊 Deleted %s records to maintain %s records per machine",
+                    deleted_by_count, self.max_records_per_machine)
 
             # Cleanup by age (if configured)
             if self.cleanup_old_records_days:
                 deleted_by_age = crud.cleanup_old_snapshots(
-                    db, days_to_keep=self.cleanup_old_records_days
+                    db, days_to_keep=self.cleanup_old_records_days,
+                    batch_size=self.cleanup_chunk_size
                 )
                 total_deleted += deleted_by_age
 
                 if deleted_by_age > 0 and should_log():
                     logger.info(
-                        f"🗓️ Deleted {deleted_by_age} records older than {self.cleanup_old_records_days} days")
+                        "🗓️ Deleted %s records older than %s days",
+                        deleted_by_age, self.cleanup_old_records_days)
 
             if total_deleted == 0:
                 if should_log():
@@ -140,11 +169,11 @@ class CleanupService:
             else:
                 if should_log():
                     logger.info(
-                        f"✅ Cleanup completed - total {total_deleted} records deleted")
+                        "✅ Cleanup completed - total %s records deleted", total_deleted)
 
         except Exception as e:
             if should_log():
-                logger.error(f"Error during cleanup: {e}")
+                logger.error("Error during cleanup: %s", e)
             db.rollback()
         finally:
             db.close()
@@ -160,19 +189,21 @@ class CleanupService:
                 "deleted_by_count": 0,
                 "deleted_by_age": 0,
                 "total_deleted": 0,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": datetime.now(timezone.utc).isoformat()
             }
 
             # Cleanup by count
             deleted_by_count = crud.cleanup_snapshots_by_count(
-                db, max_records_per_machine=self.max_records_per_machine
+                db, max_records_per_machine=self.max_records_per_machine,
+                chunk_size=self.cleanup_chunk_size
             )
             results["deleted_by_count"] = deleted_by_count
 
             # Cleanup by age (if configured)
             if self.cleanup_old_records_days:
                 deleted_by_age = crud.cleanup_old_snapshots(
-                    db, days_to_keep=self.cleanup_old_records_days
+                    db, days_to_keep=self.cleanup_old_records_days,
+                    batch_size=self.cleanup_chunk_size
                 )
                 results["deleted_by_age"] = deleted_by_age
 
@@ -181,12 +212,12 @@ class CleanupService:
 
             if should_log():
                 logger.info(
-                    f"✅ Immediate cleanup completed - {results['total_deleted']} records deleted")
+                    "✅ Immediate cleanup completed - %s records deleted", results['total_deleted'])
             return results
 
         except Exception as e:
             if should_log():
-                logger.error(f"Error during immediate cleanup: {e}")
+                logger.error("Error during immediate cleanup: %s", e)
             db.rollback()
             raise
         finally:
@@ -1,27 +1,200 @@
 import asyncio
 import aiohttp
 import logging
+import orjson
 import os
-from typing import Dict, Any, Optional, List
+import re
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
+from sqlalchemy import Row
 from sqlalchemy.orm import Session
 
-from ..database import get_db
+from ..database import SessionLocal
 from .. import crud, schemas
-from ..models import Machine
 
 logger = logging.getLogger(__name__)
 
+# Compiled once for parse_uptime, which runs for every polled machine
+_UPTIME_DAYS_RE = re.compile(r'(\d+)\s+days?')
+_UPTIME_HMS_RE = re.compile(r'(\d+):(\d+):(\d+)')
+
+# (snapshot column values, changed machine os_name/os_version/hostname)
+PollResult = Tuple[schemas.SystemSnapshotDict, Dict[str, Any]]
+
+# Machine columns kept in sync with what Glances reports
+_SYSTEM_INFO_FIELDS = ("os_name", "os_version", "hostname")
+
+# 1 / 2**30: the memory and swap parsers multiply instead of dividing
+_INV_GIB = 1.0 / 1073741824
+
+# Copied from parse_glances_data into each polled snapshot dict
+_SNAPSHOT_FIELDS = (
+    "cpu_percent", "memory_percent", "memory_used", "memory_total",
+    "uptime", "load_avg",
+    "cpu_user", "cpu_system", "cpu_iowait", "cpu_count",
+    "swap_percent", "swap_used", "swap_total", "swap_free",
+    "battery_percent", "battery_status",
+    "sensors_data", "alert_data", "network_data", "fs_data",
+)
+
+
+# APP_ENV does not change at runtime, so read it once at import
+_LOG_ENABLED = os.getenv('APP_ENV', '').lower() != 'production'
+
+
 def should_log():
     """Check if logging should be enabled based on environment"""
-    return os.getenv('APP_ENV', '').lower() != 'production'
+    return _LOG_ENABLED
+
+
+# Glances section parsers: each takes the raw section value and fills in
+# its keys of the parsed dict
+
+def _parse_cpu(cpu_data: Any, parsed: Dict[str, Any]):
+    if not isinstance(cpu_data, dict):
+        return
+    parsed["cpu_percent"] = cpu_data.get("total")
+    parsed["cpu_user"] = cpu_data.get("user")
+    parsed["cpu_system"] = cpu_data.get("system")
+    parsed["cpu_iowait"] = cpu_data.get("iowait")
+    cpucore = cpu_data.get("cpucore")
+    if isinstance(cpucore, (list, dict)):
+        parsed["cpu_count"] = len(cpucore)
+    elif isinstance(cpucore, int):
+        parsed["cpu_count"] = cpucore
+
+
+def _parse_mem(mem_data: Any, parsed: Dict[str, Any]):
+    if not isinstance(mem_data, dict):
+        return
+    parsed["memory_percent"] = mem_data.get("percent")
+    if "used" in mem_data:
+        parsed["memory_used"] = mem_data["used"] * _INV_GIB
+    if "total" in mem_data:
+        parsed["memory_total"] = mem_data["total"] * _INV_GIB
+
+
+def _parse_memswap(swap_data: Any, parsed: Dict[str, Any]):
+    if not isinstance(swap_data, dict):
+        return
+    parsed["swap_percent"] = swap_data.get("percent")
+    if "used" in swap_data:
+        parsed["swap_used"] = float(swap_data["used"]) * _INV_GIB
+    if "total" in swap_data:
+        parsed["swap_total"] = float(swap_data["total"]) * _INV_GIB
+    if "free" in swap_data:
+        parsed["swap_free"] = float(swap_data["free"]) * _INV_GIB
+
+
+def _parse_fs(fs_list: Any, parsed: Dict[str, Any]):
+    # Disk data is served from the complete fs_data JSON
+    if isinstance(fs_list, list):
+        parsed["fs_data"] = fs_list
+
+
+def _parse_load(load_data: Any, parsed: Dict[str, Any]):
+    if isinstance(load_data, dict):
+        parsed["load_avg"] = load_data.get("min1")  # 1-minute load average
+
+
+def _parse_system(system_data: Any, parsed: Dict[str, Any]):
+    if isinstance(system_data, dict):
+        parsed["hostname"] = system_data.get("hostname")
+        parsed["os_name"] = system_data.get("os_name")
+        parsed["os_version"] = system_data.get("os_version")
+
+
+def _parse_sensors(sensors: Any, parsed: Dict[str, Any]):
+    # Battery comes from the sensors list; string values (like
+    # "Not available") are stored as well. Scanning from the end keeps the
+    # last "Battery" entry, as the webhook parser does
+    if isinstance(sensors, list):
+        battery = next(
+            (sensor for sensor in reversed(sensors)
+             if isinstance(sensor, dict) and sensor.get("label") == "Battery"),
+            None)
+        if battery is not None:
+            if "value" in battery:
+                parsed["battery_percent"] = float(battery.get("value", 0))
+            if "status" in battery:
+                parsed["battery_status"] = str(battery.get("status"))
+    parsed["sensors_data"] = sensors
+
+
+def _parse_alert(alert: Any, parsed: Dict[str, Any]):
+    # Stored as-is, including string values like "Not available"
+    parsed["alert_data"] = alert
+
+
+def _parse_network(network: Any, parsed: Dict[str, Any]):
+    if isinstance(network, list):
+        parsed["network_data"] = network
+
+
+def _parse_uptime(uptime_raw: Any) -> int:
+    """Uptime in seconds from a number or a "30 days, 17:37:37" style string"""
+    if not isinstance(uptime_raw, str):
+        return int(uptime_raw) if uptime_raw else 0
+
+    try:
+        # Extract days, hours, minutes, seconds
+        days_match = _UPTIME_DAYS_RE.search(uptime_raw)
+        time_match = _UPTIME_HMS_RE.search(uptime_raw)
+
+        days = int(days_match.group(1)) if days_match else 0
+        hours = int(time_match.group(1)) if time_match else 0
+        minutes = int(time_match.group(2)) if time_match else 0
+        seconds = int(time_match.group(3)) if time_match else 0
+
+        return days * 86400 + hours * 3600 + minutes * 60 + seconds
+    except Exception as e:
+        if should_log():
+            logger.warning("Failed to parse uptime '%s': %s", uptime_raw, e)
+        return 0
+
+
+# Top-level Glances section -> parser, applied in this order
+_SECTION_PARSERS = {
+    "cpu": _parse_cpu,
+    "mem": _parse_mem,
+    "memswap": _parse_memswap,
+    "fs": _parse_fs,
+    "load": _parse_load,
+    "system": _parse_system,
+    "sensors": _parse_sensors,
+    "alert": _parse_alert,
+    "network": _parse_network,
+}
 
 
 class GlancesPoller:
-    def __init__(self, poll_interval: int = 30):
+    def __init__(self, poll_interval: int = 30, max_concurrent_polls: int = 16):
         self.poll_interval = poll_interval
         self.session_timeout = aiohttp.ClientTimeout(total=10)
         self.running = False
+        # Caps in-flight Glances requests per tick
+        self.max_concurrent_polls = max_concurrent_polls
+        # Shared HTTP session, created lazily inside the running event loop
+        self.http_session: Optional[aiohttp.ClientSession] = None
+
+    def _get_http_session(self) -> aiohttp.ClientSession:
+        """Return the shared keep-alive session, creating it on first use"""
+        if self.http_session is None or self.http_session.closed:
+            self.http_session = aiohttp.ClientSession(
+                timeout=self.session_timeout,
+                connector=aiohttp.TCPConnector(
+                    limit=0,  # concurrency is bounded by the poll semaphore
+                    limit_per_host=4,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60
+                )
+            )
+        return self.http_session
+
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self.http_session and not self.http_session.closed:
+            await self.http_session.close()
 
     async def start_polling(self):
         """Start the polling loop"""
@@ -35,164 +208,158 @@ class GlancesPoller:
                 await asyncio.sleep(self.poll_interval)
             except Exception as e:
                 if should_log():
-                    logger.error(f"Error in polling loop: {e}")
+                    logger.error("Error in polling loop: %s", e)
                 await asyncio.sleep(5)  # Short delay before retry
 
-    def stop_polling(self):
-        """Stop the polling loop"""
+    async def stop_polling(self):
+        """Stop the polling loop and release the shared HTTP session"""
         self.running = False
         if should_log():
             logger.info("⏹️ Stopping Glances polling service")
+        await self.close()
 
     async def poll_all_machines(self):
         """Poll all active machines for metrics"""
-        db = next(get_db())
+        db = SessionLocal()
         try:
-            machines = crud.get_active_machines(db)
+            machines = await asyncio.to_thread(crud.get_active_machines_lite, db)
             if not machines:
                 if should_log():
                     logger.debug("No active machines to poll")
                 return
 
             if should_log():
-                logger.info(f"📊 Polling {len(machines)} machines for metrics")
+                logger.info("📊 Polling %s machines for metrics", len(machines))
 
             # Create tasks for concurrent polling
+            semaphore = asyncio.Semaphore(self.max_concurrent_polls)
             tasks = []
             for machine in machines:
-                task = asyncio.create_task(self.poll_machine(db, machine))
+                task = asyncio.create_task(
+                    self._poll_with_limit(semaphore, machine))
                 tasks.append(task)
 
             # Wait for all polling tasks to complete
-            await asyncio.gather(*tasks, return_exceptions=True)
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+            # Write this tick's machine info changes and snapshots together,
+            # off the event loop
+            polled = [result for result in results if isinstance(result, tuple)]
+            if polled:
+                await asyncio.to_thread(self._store_poll_results, db, polled)
+                if should_log():
+                    logger.debug("💾 Stored %s snapshots", len(polled))
 
         except Exception as e:
             if should_log():
-                logger.error(f"Error polling machines: {e}")
+                logger.error("Error polling machines: %s", e)
         finally:
             db.close()
 
-    async def poll_machine(self, db: Session, machine: Machine):
+    def _store_poll_results(self, db: Session, polled: List[PollResult]):
+        """Apply reported machine info changes, then insert all snapshots in one batch"""
+        for snapshot, system_info in polled:
+            if not system_info:
+                continue
+            # Each update commits on its own; a failing machine keeps its
+            # old info but still gets its snapshot below
+            try:
+                crud.update_machine_system_info(
+                    db, snapshot["machine_id"], system_info)
+            except Exception as e:
+                db.rollback()
+                if should_log():
+                    logger.error("Error updating system info for machine %s: %s",
+                                 snapshot["machine_id"], e)
+
+        crud.create_system_snapshots_bulk(
+            db, [snapshot for snapshot, _ in polled])
+
+    async def _poll_with_limit(self, semaphore: asyncio.Semaphore, machine: Row) -> Optional[PollResult]:
+        """Poll a machine once a concurrency slot is free"""
+        async with semaphore:
+            return await self.poll_machine(machine)
+
+    async def poll_machine(self, machine: Row) -> Optional[PollResult]:
         """Poll a single machine for Glances data"""
         try:
             glances_url = f"http://{machine.ip_address}:61208/api/4/all"
             if should_log():
-                logger.info(
-                    f"🔗 Attempting to poll {machine.name} at {glances_url}")
-
-            async with aiohttp.ClientSession(timeout=self.session_timeout) as session:
-                async with session.get(glances_url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if should_log():
-                            logger.info(
-                                f"✅ Successfully connected to {machine.name}, processing data...")
-                        await self.process_glances_data(db, machine, data)
-
-                        # Update last_seen timestamp
-                        crud.update_machine_last_seen(db, machine.id)
-
-                        if should_log():
-                            logger.info(f"✅ Successfully polled {machine.name}")
-                    else:
-                        if should_log():
-                            logger.warning(
-                                f"❌ Failed to poll {machine.name}: HTTP {response.status}")
+                logger.info("🔗 Attempting to poll %s at %s", machine.name, glances_url)
+
+            session = self._get_http_session()
+            async with session.get(glances_url) as response:
+                if response.status == 200:
+                    # orjson parses the large fs/network/sensors payloads
+                    # much faster than the stdlib json used by response.json()
+                    data = orjson.loads(await response.read())
+                    if should_log():
+                        logger.info(
+                            "✅ Successfully connected to %s, processing data...", machine.name)
+                    result = self.process_glances_data(machine, data)
+
+                    if should_log():
+                        logger.info("✅ Successfully polled %s", machine.name)
+                    return result
+                else:
+                    if should_log():
+                        logger.warning(
+                            "❌ Failed to poll %s: HTTP %s", machine.name, response.status)
 
         except asyncio.TimeoutError:
             if should_log():
                 logger.warning(
-                    f"⏰ Timeout polling {machine.name} at {machine.ip_address}")
+                    "⏰ Timeout polling %s at %s", machine.name, machine.ip_address)
         except aiohttp.ClientError as e:
             if should_log():
-                logger.warning(f"🔌 Connection error polling {machine.name}: {e}")
+                logger.warning("🔌 Connection error polling %s: %s", machine.name, e)
+        except orjson.JSONDecodeError as e:
+            if should_log():
+                logger.warning("📄 Invalid JSON from %s: %s", machine.name, e)
         except Exception as e:
             if should_log():
-                logger.error(f"💥 Unexpected error polling {machine.name}: {e}")
+                logger.error("💥 Unexpected error polling %s: %s", machine.name, e)
 
-    async def process_glances_data(self, db: Session, machine: Machine, data: Dict[str, Any]):
-        """Process and store Glances data for a machine"""
+        return None
+
+    def process_glances_data(self, machine: Row, data: Dict[str, Any]) -> Optional[PollResult]:
+        """Process Glances data into a snapshot and any machine info changes"""
         try:
             # Debug: Log the keys we receive from Glances API
             # logger.info(f"🔍 Polling received data keys: {list(data.keys())}")
 
             parsed_data = self.parse_glances_data(data)
 
-            # Update machine system info if empty or different
-            machine_updated = False
-            os_name = parsed_data.get("os_name")
-            os_version = parsed_data.get("os_version")
-            hostname = parsed_data.get("hostname")
-
-            if os_name and (not machine.os_name or machine.os_name != os_name):
-                machine.os_name = os_name
-                machine_updated = True
-
-            if os_version and (not machine.os_version or machine.os_version != os_version):
-                machine.os_version = os_version
-                machine_updated = True
-
-            if hostname and (not machine.hostname or machine.hostname != hostname):
-                machine.hostname = hostname
-                machine_updated = True
-
-            if machine_updated:
-                db.commit()
-                db.refresh(machine)
-
-            # Create snapshot record with all metrics
-            snapshot_data = schemas.SystemSnapshotCreate(
-                machine_id=machine.id,
-                cpu_percent=parsed_data.get("cpu_percent"),
-                memory_percent=parsed_data.get("memory_percent"),
-                memory_used=parsed_data.get("memory_used"),
-                memory_total=parsed_data.get("memory_total"),
-
-                uptime=parsed_data.get("uptime"),
-                load_avg=parsed_data.get("load_avg"),
-                # Additional CPU metrics
-                cpu_user=parsed_data.get("cpu_user"),
-                cpu_system=parsed_data.get("cpu_system"),
-                cpu_iowait=parsed_data.get("cpu_iowait"),
-                cpu_count=parsed_data.get("cpu_count"),
-                # Memory swap metrics
-                swap_percent=parsed_data.get("swap_percent"),
-                swap_used=parsed_data.get("swap_used"),
-                swap_total=parsed_data.get("swap_total"),
-                swap_free=parsed_data.get("swap_free"),
-
-                # Battery metrics
-                battery_percent=parsed_data.get("battery_percent"),
-                battery_status=parsed_data.get("battery_status"),
-                # JSON data structures
-                sensors_data=parsed_data.get("sensors_data"),
-                alert_data=parsed_data.get("alert_data"),
-                network_data=parsed_data.get("network_data"),
-                fs_data=parsed_data.get("fs_data"),
-                # Source identifier
-                source="api"
-            )
+            # Update machine system info if empty or different; applied in
+            # one guarded UPDATE with no refresh, and skipped when unchanged
+            system_info = {
+                field: parsed_data[field]
+                for field in _SYSTEM_INFO_FIELDS
+                if parsed_data.get(field) and getattr(machine, field) != parsed_data[field]
+            }
 
-            # Store in database
-            crud.create_system_snapshot(db, snapshot_data)
-            if should_log():
-                logger.debug(f"💾 Stored snapshot for {machine.name}")
+            # Snapshot column values straight from our own parser; no
+            # Pydantic pass for data we just produced
+            snapshot_data: schemas.SystemSnapshotDict = {
+                field: parsed_data.get(field) for field in _SNAPSHOT_FIELDS}
+            snapshot_data["machine_id"] = machine.id
+            snapshot_data["source"] = "api"
+
+            # Stored in one batch by poll_all_machines
+            return snapshot_data, system_info
 
         except Exception as e:
             if should_log():
-                logger.error(f"Error processing data for {machine.name}: {e}")
+                logger.error("Error processing data for %s: %s", machine.name, e)
+            return None
 
     def parse_glances_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Parse Glances data and extract relevant metrics"""
-        # Extract hostname from system data or fallback to root level
-        hostname = "unknown"
-        if "system" in data and isinstance(data["system"], dict):
-            hostname = data["system"].get("hostname", "unknown")
-        else:
-            hostname = data.get("hostname", "unknown")
-
         parsed = {
-            "hostname": hostname,
+            # Root-level fallback; _parse_system prefers the system section.
+            # Missing stays None: hostname is unique, so a shared placeholder
+            # would collide between machines
+            "hostname": data.get("hostname"),
             "cpu_percent": None,
             "memory_percent": None,
             "memory_used": None,
@@ -220,125 +387,14 @@ class GlancesPoller:
             "fs_data": None
         }
 
-        # Parse CPU data
-        if "cpu" in data and isinstance(data["cpu"], dict):
-            cpu_data = data["cpu"]
-            parsed["cpu_percent"] = cpu_data.get("total")
-            parsed["cpu_user"] = cpu_data.get("user")
-            parsed["cpu_system"] = cpu_data.get("system")
-            parsed["cpu_iowait"] = cpu_data.get("iowait")
-            if "cpucore" in cpu_data and isinstance(cpu_data["cpucore"], (list, dict)):
-                parsed["cpu_count"] = len(cpu_data["cpucore"])
-            elif "cpucore" in cpu_data and isinstance(cpu_data["cpucore"], int):
-                parsed["cpu_count"] = cpu_data["cpucore"]
-
-        # Parse memory data
-        if "mem" in data and isinstance(data["mem"], dict):
-            mem_data = data["mem"]
-            parsed["memory_percent"] = mem_data.get("percent")
-            if "used" in mem_data:
-                parsed["memory_used"] = mem_data["used"] / \
-                    (1024**3)  # Convert to GB
-            if "total" in mem_data:
-                parsed["memory_total"] = mem_data["total"] / \
-                    (1024**3)  # Convert to GB
-
-        # Parse memory swap data
-        if "memswap" in data and isinstance(data["memswap"], dict):
-            swap_data = data["memswap"]
-            parsed["swap_percent"] = swap_data.get("percent")
-            if "used" in swap_data:
-                parsed["swap_used"] = float(
-                    swap_data["used"]) / (1024**3)  # Convert to GB
-            if "total" in swap_data:
-                parsed["swap_total"] = float(
-                    swap_data["total"]) / (1024**3)  # Convert to GB
-            if "free" in swap_data:
-                parsed["swap_free"] = float(
-                    swap_data["free"]) / (1024**3)  # Convert to GB
-
-        # Parse disk data (use root filesystem)
-        if "fs" in data and isinstance(data["fs"], list) and len(data["fs"]) > 0:
-            # Find root filesystem or use first one
-            root_fs = None
-            for fs in data["fs"]:
-                if fs.get("mnt_point") == "/":
-                    root_fs = fs
-                    break
-            if not root_fs and data["fs"]:
-                root_fs = data["fs"][0]  # Use first filesystem as fallback
-
-            if root_fs:
-                pass  # Disk data now available through fs_data JSON
-
-        # Parse uptime (convert to seconds if it's a string)
-        uptime_raw = data.get('uptime', 0)
-        if isinstance(uptime_raw, str):
-            # Parse uptime string like "30 days, 17:37:37" to seconds
-            try:
-                import re
-                # Extract days, hours, minutes, seconds
-                days_match = re.search(r'(\d+)\s+days?', uptime_raw)
-                time_match = re.search(r'(\d+):(\d+):(\d+)', uptime_raw)
-
-                days = int(days_match.group(1)) if days_match else 0
-                hours = int(time_match.group(1)) if time_match else 0
-                minutes = int(time_match.group(2)) if time_match else 0
-                seconds = int(time_match.group(3)) if time_match else 0
-
-                parsed["uptime"] = days * 86400 + \
-                    hours * 3600 + minutes * 60 + seconds
-            except Exception as e:
-                if should_log():
-                    logger.warning(f"Failed to parse uptime '{uptime_raw}': {e}")
-                parsed["uptime"] = 0
-        else:
-            parsed["uptime"] = int(uptime_raw) if uptime_raw else 0
-
-        # Parse load average
-        if "load" in data and isinstance(data["load"], dict):
-            parsed["load_avg"] = data["load"].get(
-                "min1")  # 1-minute load average
-
-        # Parse system info
-        if "system" in data and isinstance(data["system"], dict):
-            system_data = data["system"]
-            parsed["os_name"] = system_data.get("os_name")
-            parsed["os_version"] = system_data.get("os_version")
-
-
-
-        # Parse battery data
-        if "sensors" in data and isinstance(data["sensors"], list):
-            for sensor in data["sensors"]:
-                if isinstance(sensor, dict) and sensor.get("label") == "Battery":
-                    if "value" in sensor:
-                        parsed["battery_percent"] = float(
-                            sensor.get("value", 0))
-                    if "status" in sensor:
-                        parsed["battery_status"] = str(sensor.get("status"))
-
-        # Parse filesystem data
-        if "fs" in data and isinstance(data["fs"], list):
-            parsed["fs_data"] = data["fs"]
-
-        # Store complete JSON data structures
-        if "sensors" in data:
-            if isinstance(data["sensors"], list):
-                parsed["sensors_data"] = data["sensors"]
-            else:
-                # Store string values (like "Not available") as well
-                parsed["sensors_data"] = data["sensors"]
-
-        if "alert" in data:
-            if isinstance(data["alert"], list):
-                parsed["alert_data"] = data["alert"]
-            else:
-                # Store string values (like "Not available") as well
-                parsed["alert_data"] = data["alert"]
-
-        if "network" in data and isinstance(data["network"], list):
-            parsed["network_data"] = data["network"]
+        # One dict lookup per section; each parser works on its local value
+        for section, parser in _SECTION_PARSERS.items():
+            value = data.get(section)
+            if value is not None:
+                parser(value, parsed)
+
+        # Uptime defaults to 0 when Glances does not report it
+        parsed["uptime"] = _parse_uptime(data.get('uptime', 0))
 
         return parsed
 
@@ -352,6 +408,6 @@ async def start_glances_polling():
     await glances_poller.start_polling()
 
 
-def stop_glances_polling():
+async def stop_glances_polling():
     """Stop the Glances polling service"""
-    glances_poller.stop_polling()
+    await glances_poller.stop_polling()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Snapshot Writer Service
+
+Buffers webhook snapshots in memory and stores them with one multi-row INSERT
+per batch instead of one INSERT and commit per webhook request.
+"""
+
+import asyncio
+import logging
+import os
+from typing import Callable, List, Optional
+
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from .. import crud, schemas
+
+logger = logging.getLogger(__name__)
+
+
+_LOG_ENABLED = os.getenv('APP_ENV', '').lower() != 'production'
+
+# Queued by stop(): the writer loop flushes its current batch and exits
+_STOP = object()
+
+
+def should_log():
+    """Check if logging should be enabled based on environment"""
+    return _LOG_ENABLED
+
+
+class SnapshotWriter:
+    """Background service that flushes queued snapshots in batches"""
+
+    def __init__(self,
+                 batch_size: int = 500,
+                 flush_interval: float = 1.0,
+                 max_queue_size: int = 10000,
+                 session_factory: Callable[[], Session] = SessionLocal):
+        """
+        Initialize snapshot writer
+
+        Args:
+            batch_size: Flush as soon as this many snapshots are queued
+            flush_interval: Flush a partial batch after this many seconds
+            max_queue_size: Producers wait once this many snapshots are pending
+            session_factory: Creates the database session for each batch
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.session_factory = session_factory
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the background flush task"""
+        if self.task is not None:
+            return
+
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.task = asyncio.create_task(self._writer_loop())
+        if should_log():
+            logger.info("📝 Snapshot writer started - batches of %d, every %ss",
+                        self.batch_size, self.flush_interval)
+
+    async def stop(self):
+        """Stop the flush task and write whatever is still queued"""
+        if self.task is None:
+            return
+
+        # The loop flushes the batch it is collecting before it exits
+        await self.queue.put(_STOP)
+        await self.task
+        self.task = None
+
+        # Snapshots queued behind the sentinel
+        pending = []
+        while not self.queue.empty():
+            snapshot = self.queue.get_nowait()
+            if snapshot is not _STOP:
+                pending.append(snapshot)
+        if pending:
+            await self._flush(pending)
+
+        if should_log():
+            logger.info("🛑 Snapshot writer stopped")
+
+    async def enqueue(self, snapshot: schemas.SystemSnapshotDict):
+        """Queue a snapshot (SystemSnapshot column values) for the next batch"""
+        if self.task is None:
+            await self.start()
+        await self.queue.put(snapshot)
+
+    async def _writer_loop(self):
+        """Collect up to batch_size snapshots or wait flush_interval, then flush"""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            snapshot = await self.queue.get()
+            if snapshot is _STOP:
+                break
+            batch = [snapshot]
+            deadline = loop.time() + self.flush_interval
+
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    snapshot = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if snapshot is _STOP:
+                    stopping = True
+                    break
+                batch.append(snapshot)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[schemas.SystemSnapshotDict]):
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            # Dropped snapshots are always reported, whatever APP_ENV says
+            logger.error("Error writing %d snapshots: %s", len(batch), e)
+
+    def _write_batch(self, batch: List[schemas.SystemSnapshotDict]):
+        db = self.session_factory()
+        try:
+            try:
+                crud.create_system_snapshots_bulk(db, batch)
+                return
+            except Exception as e:
+                db.rollback()
+                if len(batch) == 1:
+                    raise
+                logger.error(
+                    "Batch of %d snapshots failed, retrying row by row: %s", len(batch), e)
+
+            # One bad row (e.g. a deleted machine) only loses itself
+            failed = 0
+            for snapshot in batch:
+                try:
+                    crud.create_system_snapshots_bulk(db, [snapshot])
+                except Exception as e:
+                    db.rollback()
+                    failed += 1
+                    logger.error("Dropped snapshot for machine %s: %s",
+                                 snapshot.get('machine_id'), e)
+            if failed:
+                logger.error("Dropped %d of %d snapshots", failed, len(batch))
+        finally:
+            db.close()
+
+
+# Global snapshot writer instance
+snapshot_writer = SnapshotWriter()
+
+
+async def start_snapshot_writer():
+    """Start the global snapshot writer"""
+    await snapshot_writer.start()
+
+
+async def stop_snapshot_writer():
+    """Flush pending snapshots and stop the global snapshot writer"""
+    await snapshot_writer.stop()
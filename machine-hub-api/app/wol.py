@@ -1,9 +1,31 @@
 import socket
 import struct
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
+# Separator characters stripped from MAC addresses in one pass
+_MAC_TRIM_TABLE = str.maketrans('', '', ':-')
+# Magic packet = 6 bytes of 0xFF + 16 repetitions of MAC address
+_MAGIC_PREFIX = b'\xff' * 6
+
+# Shared UDP socket for all wake requests, created on first use
+_WOL_SOCK = None
+_WOL_SOCK_LOCK = threading.Lock()
+
+
+def _get_wol_socket() -> socket.socket:
+    """Return the shared broadcast-enabled UDP socket, creating it if needed"""
+    global _WOL_SOCK
+    if _WOL_SOCK is None:
+        with _WOL_SOCK_LOCK:
+            if _WOL_SOCK is None:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                _WOL_SOCK = sock
+    return _WOL_SOCK
+
 
 def send_magic_packet(mac_address: str, ip_address: str = None, port: int = 9) -> dict:
     """
@@ -20,7 +42,7 @@ def send_magic_packet(mac_address: str, ip_address: str = None, port: int = 9) -
     try:
         # Clean and validate MAC address
         original_mac = mac_address
-        mac_address = mac_address.replace(':', '').replace('-', '').upper()
+        mac_address = mac_address.translate(_MAC_TRIM_TABLE).upper()
         if len(mac_address) != 12:
             return {
                 'success': False,
@@ -37,8 +59,7 @@ def send_magic_packet(mac_address: str, ip_address: str = None, port: int = 9) -
             }
 
         # Create magic packet
-        # Magic packet = 6 bytes of 0xFF + 16 repetitions of MAC address
-        magic_packet = b'\xFF' * 6 + mac_bytes * 16
+        magic_packet = _MAGIC_PREFIX + mac_bytes * 16
 
         # Determine target address
         if ip_address:
@@ -47,13 +68,8 @@ def send_magic_packet(mac_address: str, ip_address: str = None, port: int = 9) -
             # Use broadcast address
             target_address = '255.255.255.255'
 
-        # Send the magic packet
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
-            # Enable broadcast if using broadcast address
-            if target_address == '255.255.255.255':
-                sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
-
-            sock.sendto(magic_packet, (target_address, port))
+        # Send the magic packet (broadcast is enabled on the shared socket)
+        _get_wol_socket().sendto(magic_packet, (target_address, port))
 
         logger.info(
             f"Wake-on-LAN magic packet sent to {mac_address} at {target_address}:{port}")
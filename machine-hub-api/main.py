@@ -1,18 +1,25 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import Response
 from contextlib import asynccontextmanager
+from sqlalchemy.dialects.mysql import insert as mysql_insert
 import logging
 import os
+import time
 
 from app.database import engine, Base
 from app.routers import auth_router, machines_router, webhook_router
-from app import crud
-from app.database import get_db
-
-# Configure logging
+from app import models
+from app.auth import hash_password
+from app.ha_integration import ha_client
+
+# Configure logging (same LOG_LEVEL / APP_ENV defaults as app/main.py)
+LOG_LEVEL = os.getenv(
+    "LOG_LEVEL",
+    "WARNING" if os.getenv("APP_ENV", "").lower() == "production" else "INFO"
+).upper()
 logging.basicConfig(
-    level=logging.INFO,
+    level=LOG_LEVEL,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
@@ -29,22 +36,18 @@ async def lifespan(app: FastAPI):
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created successfully")
 
-        # Create default admin user if it doesn't exist
-        db = next(get_db())
-        try:
-            admin_user = crud.get_user_by_username(db, "admin")
-            if not admin_user:
-                admin_data = {
-                    "username": "admin",
-                    "email": "admin@localhost",
-                    "password": "admin123",
-                    "is_admin": True
-                }
-                crud.create_user(db, admin_data)
+        # Create default admin user if it doesn't exist. One INSERT IGNORE
+        # keyed on the unique username: no read-then-write race between
+        # workers, and an existing admin is left untouched
+        stmt = mysql_insert(models.User).prefix_with("IGNORE").values(
+            username="admin",
+            hashed_password=hash_password("admin123"),
+            is_active=True
+        )
+        with engine.begin() as conn:
+            if conn.execute(stmt).rowcount == 1:
                 logger.info(
                     "Default admin user created (username: admin, password: admin123)")
-        finally:
-            db.close()
 
     except Exception as e:
         logger.error(f"Database initialization failed: {e}")
@@ -54,6 +57,8 @@ async def lifespan(app: FastAPI):
 
     # Shutdown
     logger.info("Shutting down Machine Hub API...")
+    # The shared Home Assistant httpx client lives for the app's lifetime
+    await ha_client.aclose()
 
 # Create FastAPI app
 app = FastAPI(
@@ -63,18 +68,22 @@ app = FastAPI(
     lifespan=lifespan
 )
 
-# Configure CORS
+# Configure CORS. FRONTEND_URL usually repeats one of the defaults, so the
+# list is deduplicated (order kept) before the middleware scans it
+ALLOWED_ORIGINS = list(dict.fromkeys(filter(None, [
+    "http://localhost:3000",  # React dev server
+    "http://localhost:5173",  # Vite dev server
+    "http://machine-hub-web:3000",  # Docker container
+    os.getenv("FRONTEND_URL")
+])))
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",  # React dev server
-        "http://localhost:5173",  # Vite dev server
-        "http://machine-hub-web:3000",  # Docker container
-        os.getenv("FRONTEND_URL", "http://localhost:3000")
-    ],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Same method/header lists as app/main.py
+    allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+    allow_headers=["Authorization", "Content-Type", "X-Secret"],
 )
 
 # Include routers
@@ -85,17 +94,17 @@ app.include_router(machines_router.router,
 app.include_router(webhook_router.router,
                    prefix="/api/webhook", tags=["webhooks"])
 
+# Static bodies for the probe endpoints, encoded once at import
+_HEALTH_BODY = b'{"status":"healthy","service":"Machine Hub API","version":"1.0.0"}'
+_ROOT_BODY = b'{"message":"Machine Hub API","version":"1.0.0","docs":"/docs","health":"/health"}'
+
 # Health check endpoint
 
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "Machine Hub API",
-        "version": "1.0.0"
-    }
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
 # Root endpoint
 
@@ -103,39 +112,59 @@ async def health_check():
 @app.get("/")
 async def root():
     """Root endpoint with API information"""
-    return {
-        "message": "Machine Hub API",
-        "version": "1.0.0",
-        "docs": "/docs",
-        "health": "/health"
-    }
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 # Global exception handler
 
 
+# Same body for every unhandled error, encoded once
+_INTERNAL_ERROR_BODY = b'{"detail":"Internal server error","type":"internal_error"}'
+# Full tracebacks are logged at most once per second so an error storm
+# doesn't spend its time formatting stack traces
+_TRACEBACK_LOG_INTERVAL = 1.0
+_last_traceback_log = 0.0
+
+
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler for unhandled errors"""
-    logger.error(f"Unhandled exception: {exc}", exc_info=True)
-    return JSONResponse(
+    global _last_traceback_log
+    now = time.monotonic()
+    if now - _last_traceback_log >= _TRACEBACK_LOG_INTERVAL:
+        _last_traceback_log = now
+        logger.error("Unhandled exception: %s", exc, exc_info=True)
+    else:
+        logger.error("Unhandled exception: %r", exc)
+    return Response(
+        content=_INTERNAL_ERROR_BODY,
         status_code=500,
-        content={
-            "detail": "Internal server error",
-            "type": "internal_error"
-        }
+        media_type="application/json"
     )
 
 if __name__ == "__main__":
     import uvicorn
-    
-    # Check if we should disable access logs in production
-    access_log = os.getenv('APP_ENV', '').lower() != 'production'
-    
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info",
-        access_log=access_log
-    )
+
+    if os.getenv('APP_ENV', '').lower() == 'production':
+        # No reloader or access log; uvloop and httptools come with
+        # uvicorn[standard]. Under gunicorn use
+        # `gunicorn -k uvicorn.workers.UvicornWorker -w N main:app`
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            workers=int(os.getenv("WEB_CONCURRENCY", "1")),
+            loop="uvloop",
+            http="httptools",
+            log_level=LOG_LEVEL.lower(),
+            access_log=False,
+            # Leave uvicorn's loggers to the root config above
+            log_config=None
+        )
+    else:
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=8000,
+            reload=True,
+            log_level="info"
+        )
@@ -0,0 +1,26 @@
+/*
+ Migration: Add composite (machine_id, created_at) index to system_snapshots
+ Latest-snapshot, history and cleanup queries filter by machine_id and order
+ by created_at. MySQL drops the implicit foreign key index on machine_id once
+ this index exists, since it covers machine_id as its leftmost prefix.
+ Skipped when the index is already there (fresh databases get it from the
+ model definition).
+*/
+SET @index_exists = (
+    SELECT COUNT(*) FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+    AND table_name = 'system_snapshots'
+    AND index_name = 'ix_snap_machine_created'
+);
+
+SET @create_index = IF(
+    @index_exists = 0,
+    'CREATE INDEX ix_snap_machine_created ON system_snapshots (machine_id, created_at)',
+    'SELECT 1'
+);
+
+PREPARE create_index_stmt FROM @create_index;
+
+EXECUTE create_index_stmt;
+
+DEALLOCATE PREPARE create_index_stmt;
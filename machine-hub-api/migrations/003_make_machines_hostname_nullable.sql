@@ -0,0 +1,6 @@
+/*
+ Migration: Keep a single nullable hostname column on machines
+ The model declared hostname twice; only the later, nullable definition was
+ ever applied. Pin the column to VARCHAR(255) NULL so every database matches.
+*/
+ALTER TABLE machines MODIFY hostname VARCHAR(255) NULL;
@@ -0,0 +1,29 @@
+/*
+ Migration: Add unique index on machines.hostname
+ The "unknown" placeholder the poller used to write (never an operator value)
+ becomes NULL; the index allows any number of NULL hostnames. Any other
+ repeated hostname is left alone: init_db refuses to run this migration and
+ lists those machines until an operator resolves them. Index creation is
+ skipped when it is already there (fresh databases get it from the model
+ definition).
+*/
+UPDATE machines SET hostname = NULL WHERE hostname = 'unknown';
+
+SET @index_exists = (
+    SELECT COUNT(*) FROM information_schema.statistics
+    WHERE table_schema = DATABASE()
+    AND table_name = 'machines'
+    AND index_name = 'uq_machines_hostname'
+);
+
+SET @create_index = IF(
+    @index_exists = 0,
+    'CREATE UNIQUE INDEX uq_machines_hostname ON machines (hostname)',
+    'SELECT 1'
+);
+
+PREPARE create_index_stmt FROM @create_index;
+
+EXECUTE create_index_stmt;
+
+DEALLOCATE PREPARE create_index_stmt;
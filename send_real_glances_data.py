@@ -6,37 +6,120 @@ Sends actual system metrics from Glances to the webhook endpoint
 
 import subprocess
 import json
+import functools
 import requests
 import time
 import os
+import socket
 import sys
 import argparse
-from datetime import datetime
-
-# Check if we're in production environment from command line or env
-
-
-def get_environment():
-    # Check command line arguments first
-    for i, arg in enumerate(sys.argv):
-        if arg == '--env' and i + 1 < len(sys.argv):
-            return sys.argv[i + 1].lower() == 'production'
-    # Fall back to environment variable
-    return os.getenv('ENV', '').lower() == 'production'
+import signal
+import platform
+import glob
+import threading
+import collections
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+try:
+    # Serializes the large Glances payload several times faster than json
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    # Reads hwmon sensors in-process instead of forking `sensors`
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+
+class KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose sockets also enable TCP keepalive probes
+
+    urllib3 already sets TCP_NODELAY; SO_KEEPALIVE lets the kernel notice a
+    dead pooled connection between ticks instead of the next POST finding it.
+    """
+
+    SOCKET_OPTIONS = HTTPConnection.default_socket_options + [
+        (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+    ]
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['socket_options'] = self.SOCKET_OPTIONS
+        return super().init_poolmanager(*args, **kwargs)
+
+
+def create_http_session():
+    """Create the session shared by the Glances, ipify and webhook calls
+
+    Keeps connections alive between ticks so each send doesn't pay a fresh
+    TCP (and TLS) handshake per request.
+    """
+    session = requests.Session()
+    adapter = KeepAliveAdapter(
+        pool_connections=8,
+        pool_maxsize=8,
+        max_retries=Retry(total=2, backoff_factor=0.2)
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Connection'] = 'keep-alive'
+    return session
+
+
+SESSION = create_http_session()
+
+
+def decode_json(content):
+    """Decode a response body straight from bytes, with orjson when available"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def encode_json(data):
+    """Encode a payload for a request body, with orjson when available"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':')).encode()
+
+
+@functools.lru_cache(maxsize=4)
+def webhook_headers(secret):
+    """Webhook request headers, built once per secret"""
+    return {
+        'Content-Type': 'application/json',
+        'X-Secret': secret
+    }
 
 
-IS_PRODUCTION = get_environment()
+# Glances sections the webhook stores; processlist and programlist alone are
+# most of /api/4/all and are never used
+WEBHOOK_SECTIONS = (
+    'cpu', 'mem', 'memswap', 'load', 'system', 'uptime', 'hostname',
+    'sensors', 'alert', 'network', 'fs',
+)
 
 
 def get_real_glances_data():
     """Get real system data from Glances REST API"""
     try:
-        # Get data from Glances REST API running on port 61208
+        # Get data from Glances REST API running on port 61208. One /all
+        # request per tick; a GET per plugin would add a round trip each
         glances_api_url = 'http://192.168.100.72:61208/api/4/all'
-        response = requests.get(glances_api_url, timeout=10)
+        response = SESSION.get(glances_api_url, timeout=10)
 
         if response.status_code == 200:
-            return response.json()
+            # response.json() would first guess the charset of the whole
+            # body; Glances always sends UTF-8 JSON
+            data = decode_json(response.content)
+            return {key: data[key] for key in WEBHOOK_SECTIONS if key in data}
         else:
             print(
                 f"Error getting data from Glances API: {response.status_code}")
@@ -53,39 +136,307 @@ def get_real_glances_data():
         return None
 
 
+# Operating system, resolved once for the life of the process
+SYSTEM = platform.system().lower()
+
+# thermal_zone*/type values that identify CPU/SoC package sensors
+CPU_ZONE_TYPES = ('x86_pkg_temp', 'coretemp', 'cpu', 'soc')
+
+
+def discover_cpu_thermal_zones():
+    """List the temp files of CPU thermal zones
+
+    Wifi, battery and ACPI zones are skipped. If no zone type looks like a
+    CPU, every zone is kept so the machine still reports something.
+    """
+    zones = glob.glob('/sys/class/thermal/thermal_zone*/temp')
+    cpu_zones = []
+    for path in zones:
+        try:
+            with open(os.path.join(os.path.dirname(path), 'type')) as f:
+                zone_type = f.read().strip().lower()
+        except OSError:
+            continue
+        if any(name in zone_type for name in CPU_ZONE_TYPES):
+            cpu_zones.append(path)
+    return cpu_zones or zones
+
+
+# Thermal zones don't come and go at runtime, so scan /sys only once
+THERMAL_ZONE_PATHS = discover_cpu_thermal_zones() if SYSTEM == 'linux' else []
+# zone path -> open file descriptor, kept across samples
+_THERMAL_FDS = {}
+
+
+def read_thermal_zone(path):
+    """Read a thermal zone with a single pread on a cached descriptor"""
+    fd = _THERMAL_FDS.get(path)
+    if fd is None:
+        fd = _THERMAL_FDS[path] = os.open(path, os.O_RDONLY)
+    try:
+        raw = os.pread(fd, 32, 0)
+    except OSError:
+        _THERMAL_FDS.pop(path, None)
+        os.close(fd)
+        raise
+    if not raw:
+        # Zone went away underneath us; reopen on the next sample
+        _THERMAL_FDS.pop(path, None)
+        os.close(fd)
+    return raw.decode()
+
+
+def _powermetrics_power(label, high_watts):
+    """Build the handler for an "X Power: N mW" line"""
+    def parse(key, value):
+        if not value.endswith('mW'):
+            return None
+        watts = float(value[:-2]) / 1000.0  # Convert mW to W
+        return {
+            "label": label,
+            "value": watts,
+            "unit": "W",
+            "status": "Normal" if watts < high_watts else "High",
+            "type": "power",
+            "key": "label"
+        }
+    return parse
+
+
+def _powermetrics_cpu_frequency(key, value):
+    """Handle a "CPU N frequency: F MHz" line"""
+    if not value.endswith('MHz'):
+        return None
+    freq_value = float(value[:-3])
+    return {
+        "label": f"CPU {key.split()[1]} Frequency",
+        "value": freq_value,
+        "unit": "MHz",
+        "status": "High" if freq_value > 2000 else "Normal",
+        "type": "frequency",
+        "key": "label"
+    }
+
+
+def _powermetrics_gpu_frequency(key, value):
+    """Handle the "GPU HW active frequency: F MHz" line"""
+    if not value.endswith('MHz'):
+        return None
+    freq_value = float(value[:-3])
+    return {
+        "label": "GPU Frequency",
+        "value": freq_value,
+        "unit": "MHz",
+        "status": "Active" if freq_value > 400 else "Idle",
+        "type": "frequency",
+        "key": "label"
+    }
+
+
+# Readings at or above this many °C are reported as "Hot"
+HOT_TEMPERATURE_C = 80
+
+
+def temperature_status(celsius):
+    """Status label shared by every temperature source"""
+    return "Normal" if celsius < HOT_TEMPERATURE_C else "Hot"
+
+
+# Estimated CPU temperature for each macOS thermal pressure level
+PRESSURE_TO_TEMP = {
+    'Nominal': 45.0,
+    'Fair': 65.0,
+    'Serious': 80.0,
+    'Critical': 95.0
+}
+
+
+def _powermetrics_pressure(key, value):
+    """Handle the "Current pressure level: L" line"""
+    return {
+        "label": "CPU Temperature",
+        "value": PRESSURE_TO_TEMP.get(value, 50.0),
+        "unit": "°C",
+        "status": value,
+        "type": "temperature",
+        "key": "label"
+    }
+
+
+# Normalized powermetrics line label -> handler(key, value)
+_POWERMETRICS_PARSERS = {
+    'cpu power': _powermetrics_power("CPU Power", 5.0),
+    'gpu power': _powermetrics_power("GPU Power", 10.0),
+    'combined power': _powermetrics_power("Combined Power", 15.0),
+    'cpu frequency': _powermetrics_cpu_frequency,
+    'gpu hw active frequency': _powermetrics_gpu_frequency,
+    'current pressure level': _powermetrics_pressure,
+}
+
+
+def parse_powermetrics_line(line):
+    """Turn one line of powermetrics output into a sensor dict, or None"""
+    key, sep, value = line.strip().partition(':')
+    if not sep:
+        return None
+    # "Combined Power (CPU + GPU + ANE)" and "CPU 3 frequency" carry
+    # variable parts; fold them onto their table entry
+    name = key.split(' (', 1)[0].lower()
+    if name.startswith('cpu ') and name.endswith(' frequency'):
+        name = 'cpu frequency'
+    handler = _POWERMETRICS_PARSERS.get(name)
+    if handler is None:
+        return None
+    return handler(key, value.strip())
+
+
+# Set while sudo holds cached credentials for this process
+SUDO_TICKET = threading.Event()
+# sudo forgets credentials after 5 minutes of disuse by default
+_SUDO_REFRESH_SECONDS = 240
+
+
+def refresh_sudo_ticket(system_password):
+    """Validate (and so extend) the sudo ticket; returns whether it is live"""
+    try:
+        result = subprocess.run(
+            ['sudo', '-S', '-v'],
+            input=system_password + '\n',
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            timeout=15
+        )
+        ok = result.returncode == 0
+    except (subprocess.SubprocessError, FileNotFoundError):
+        ok = False
+    if ok:
+        SUDO_TICKET.set()
+    else:
+        SUDO_TICKET.clear()
+    return ok
+
+
+def start_sudo_keepalive(system_password):
+    """Cache sudo credentials and keep them fresh in a background thread
+
+    powermetrics can then run under `sudo -n` each tick instead of going
+    through password authentication every time.
+    """
+    def keepalive():
+        while True:
+            time.sleep(_SUDO_REFRESH_SECONDS)
+            refresh_sudo_ticket(system_password)
+
+    refresh_sudo_ticket(system_password)
+    threading.Thread(target=keepalive, name='sudo-keepalive',
+                     daemon=True).start()
+
+
+class PowermetricsStream:
+    """A long-lived `powermetrics -i` process and its latest parsed sample
+
+    One process sampling at the sender's cadence replaces spawning
+    `powermetrics -n 1` (and its SMC setup) on every tick.
+    """
+
+    # Every sample in the text output starts with this header
+    SAMPLE_HEADER = '*** Sampled system activity'
+
+    def __init__(self, interval_seconds):
+        self.interval_ms = max(int(interval_seconds * 1000), 1000)
+        self.process = None
+        self._latest = collections.deque(maxlen=1)
+
+    def start(self):
+        """Spawn powermetrics under the cached sudo ticket"""
+        self.process = subprocess.Popen(
+            ['sudo', '-n', 'powermetrics', '--samplers',
+             'cpu_power,thermal,gpu_power', '-i', str(self.interval_ms)],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1
+        )
+        threading.Thread(target=self._read, name='powermetrics-reader',
+                         daemon=True).start()
+
+    def _read(self):
+        sample = []
+        for line in self.process.stdout:
+            if line.startswith(self.SAMPLE_HEADER):
+                # The next header marks the previous sample as complete
+                if sample:
+                    self._latest.append(sample)
+                sample = []
+                continue
+            try:
+                sensor = parse_powermetrics_line(line)
+            except (ValueError, IndexError):
+                continue
+            if sensor is not None:
+                sample.append(sensor)
+        if sample:
+            self._latest.append(sample)
+
+    def latest(self):
+        """Sensors from the most recent complete sample, or None"""
+        if self.process is None or self.process.poll() is not None:
+            return None
+        return list(self._latest[0]) if self._latest else None
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            # sudo relays SIGTERM to powermetrics
+            self.process.terminate()
+
+
+# Started by main() on macOS once a sudo ticket is cached
+POWERMETRICS_STREAM = None
+
+
 def get_temperature_data(system_password=None):
     """Get temperature data based on operating system"""
-    import platform
-    system = platform.system().lower()
+    system = SYSTEM
     temperature_sensors = []
 
     try:
         if system == 'linux':
-            # Try to read from thermal zones
-            try:
-                import glob
-                thermal_zones = glob.glob(
-                    '/sys/class/thermal/thermal_zone*/temp')
-                for i, zone_file in enumerate(thermal_zones):
-                    try:
-                        with open(zone_file, 'r') as f:
-                            temp_millicelsius = int(f.read().strip())
-                            temp_celsius = temp_millicelsius / 1000.0
+            # Read the thermal zones discovered at import
+            for i, zone_file in enumerate(THERMAL_ZONE_PATHS):
+                try:
+                    temp_millicelsius = int(read_thermal_zone(zone_file).strip())
+                    temp_celsius = temp_millicelsius / 1000.0
+                    temperature_sensors.append({
+                        "label": f"CPU Thermal Zone {i}",
+                        "value": round(temp_celsius, 1),
+                        "unit": "°C",
+                        "status": temperature_status(temp_celsius),
+                        "type": "temperature",
+                        "key": "label"
+                    })
+                except (OSError, ValueError):
+                    continue
+
+            # Fallback: hwmon sensors through psutil when it is installed
+            if not temperature_sensors and psutil is not None:
+                try:
+                    for chip, entries in psutil.sensors_temperatures().items():
+                        for entry in entries:
                             temperature_sensors.append({
-                                "label": f"CPU Thermal Zone {i}",
-                                "value": round(temp_celsius, 1),
+                                "label": entry.label or chip,
+                                "value": round(entry.current, 1),
                                 "unit": "°C",
-                                "status": "Normal" if temp_celsius < 80 else "Hot",
+                                "status": temperature_status(entry.current),
                                 "type": "temperature",
                                 "key": "label"
                             })
-                    except (IOError, ValueError):
-                        continue
-            except ImportError:
-                pass
+                except (AttributeError, OSError):
+                    pass
 
-            # Fallback: try sensors command
-            if not temperature_sensors:
+            # Last resort: parse the output of the sensors command
+            if not temperature_sensors and psutil is None:
                 try:
                     result = subprocess.run(
                         ['sensors'], capture_output=True, text=True)
@@ -106,7 +457,7 @@ def get_temperature_data(system_password=None):
                                                 "label": label,
                                                 "value": round(temp_value, 1),
                                                 "unit": "°C",
-                                                "status": "Normal" if temp_value < 80 else "Hot",
+                                                "status": temperature_status(temp_value),
                                                 "type": "temperature",
                                                 "key": "label"
                                             })
@@ -118,219 +469,81 @@ def get_temperature_data(system_password=None):
 
         elif system == 'darwin':  # macOS
             # Try powermetrics with sudo for accurate temperature readings
-            if system_password:
-                if not IS_PRODUCTION:
-                    print("[DEBUG] Attempting powermetrics with sudo...")
+            streamed = POWERMETRICS_STREAM.latest() if POWERMETRICS_STREAM else None
+            if streamed:
+                temperature_sensors.extend(streamed)
+            elif system_password:
+                logger.debug("Attempting powermetrics with sudo...")
                 try:
-                    # Use powermetrics with sudo to get CPU, thermal, and GPU sensor data
-                    cmd = ['sudo', '-S', 'powermetrics', '--samplers',
-                           'cpu_power,thermal,gpu_power', '-n', '1']
-                    if not IS_PRODUCTION:
-                        print(f"[DEBUG] Running command: {' '.join(cmd)}")
-
+                    # Use powermetrics with sudo to get CPU, thermal, and GPU sensor data.
+                    # With a live sudo ticket the password isn't piped in
+                    use_ticket = SUDO_TICKET.is_set()
+                    cmd = ['sudo', '-n' if use_ticket else '-S', 'powermetrics',
+                           '--samplers', 'cpu_power,thermal,gpu_power', '-n', '1']
+                    logger.debug("Running command: %s", ' '.join(cmd))
+
+                    # Parse lines as powermetrics writes them instead of
+                    # holding the whole output (and a split copy) in memory
                     process = subprocess.Popen(
                         cmd,
-                        stdin=subprocess.PIPE,
+                        stdin=subprocess.DEVNULL if use_ticket else subprocess.PIPE,
                         stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True
+                        stderr=subprocess.DEVNULL,
+                        text=True,
+                        bufsize=1
                     )
-                    stdout, stderr = process.communicate(
-                        input=system_password + '\n', timeout=15)
+                    watchdog = threading.Timer(15, process.kill)
+                    watchdog.start()
+                    found = []
+                    try:
+                        if not use_ticket:
+                            process.stdin.write(system_password + '\n')
+                            process.stdin.close()
+                        for line in process.stdout:
+                            try:
+                                sensor = parse_powermetrics_line(line)
+                            except (ValueError, IndexError):
+                                continue
+                            if sensor is not None:
+                                found.append(sensor)
+                        process.wait()
+                        timed_out = watchdog.finished.is_set()
+                    finally:
+                        watchdog.cancel()
+                        process.stdout.close()
 
                     if process.returncode == 0:
-                        lines = stdout.split('\n')
-                        if not IS_PRODUCTION:
-                            print(
-                                f"[DEBUG] Processing {len(lines)} lines of output")
-
-                        # Parse comprehensive powermetrics data
-                        sensors_found = False
-                        current_section = None
-
-                        for i, line in enumerate(lines):
-                            line_stripped = line.strip()
-                            line_lower = line_stripped.lower()
-                            # Parse CPU Power (appears directly without section header)
-                            if 'cpu power:' in line_lower:
-                                try:
-                                    power_match = line_stripped.split(
-                                        'CPU Power:')[-1].strip()
-                                    if 'mW' in power_match:
-                                        power_value_mw = float(
-                                            power_match.replace('mW', '').strip())
-                                        power_value_w = power_value_mw / 1000.0  # Convert mW to W
-                                        temperature_sensors.append({
-                                            "label": "CPU Power",
-                                            "value": power_value_w,
-                                            "unit": "W",
-                                            "status": "Normal" if power_value_w < 5.0 else "High",
-                                            "type": "power",
-                                            "key": "label"
-                                        })
-                                        sensors_found = True
-                                        if not IS_PRODUCTION:
-                                            print(
-                                                f"[DEBUG] Found CPU Power: {power_value_w} W")
-                                except (ValueError, IndexError):
-                                    continue
-
-                            # Parse GPU Power (appears directly and also in GPU usage section)
-                            elif 'gpu power:' in line_lower:
-                                try:
-                                    gpu_power_match = line_stripped.split(
-                                        'GPU Power:')[-1].strip()
-                                    if 'mW' in gpu_power_match:
-                                        gpu_power_value_mw = float(
-                                            gpu_power_match.replace('mW', '').strip())
-                                        gpu_power_value_w = gpu_power_value_mw / 1000.0  # Convert mW to W
-                                        temperature_sensors.append({
-                                            "label": "GPU Power",
-                                            "value": gpu_power_value_w,
-                                            "unit": "W",
-                                            "status": "Normal" if gpu_power_value_w < 10.0 else "High",
-                                            "type": "power",
-                                            "key": "label"
-                                        })
-                                        sensors_found = True
-                                        if not IS_PRODUCTION:
-                                            print(
-                                                f"[DEBUG] Found GPU Power: {gpu_power_value_w} W")
-                                except (ValueError, IndexError):
-                                    continue
-
-                            # Parse Combined Power
-                            elif 'combined power' in line_lower and 'mw' in line_lower:
-                                try:
-                                    combined_match = line_stripped.split(
-                                        '):')[-1].strip()
-                                    if 'mW' in combined_match:
-                                        combined_value_mw = float(
-                                            combined_match.replace('mW', '').strip())
-                                        combined_value_w = combined_value_mw / 1000.0  # Convert mW to W
-                                        temperature_sensors.append({
-                                            "label": "Combined Power",
-                                            "value": combined_value_w,
-                                            "unit": "W",
-                                            "status": "Normal" if combined_value_w < 15.0 else "High",
-                                            "type": "power",
-                                            "key": "label"
-                                        })
-                                        sensors_found = True
-                                        if not IS_PRODUCTION:
-                                            print(
-                                                f"[DEBUG] Found Combined Power: {combined_value_w} W")
-                                except (ValueError, IndexError):
-                                    continue
-
-                            # Parse CPU cluster information (in processor usage section)
-                            elif current_section == 'processor usage':
-                                # Individual CPU core frequencies (CPU 0-7)
-                                if line_lower.startswith('cpu ') and 'frequency:' in line_lower:
-                                    try:
-                                        cpu_num = line_stripped.split()[1]
-                                        freq_match = line_stripped.split(
-                                            'frequency:')[-1].strip()
-                                        if 'MHz' in freq_match:
-                                            freq_value = float(
-                                                freq_match.replace('MHz', '').strip())
-                                            temperature_sensors.append({
-                                                "label": f"CPU {cpu_num} Frequency",
-                                                "value": freq_value,
-                                                "unit": "MHz",
-                                                "status": "High" if freq_value > 2000 else "Normal",
-                                                "type": "frequency",
-                                                "key": "label"
-                                            })
-                                            sensors_found = True
-                                            if not IS_PRODUCTION:
-                                                print(
-                                                    f"[DEBUG] Found CPU {cpu_num} Frequency: {freq_value} MHz")
-                                    except (ValueError, IndexError):
-                                        continue
-
-                            # Parse Thermal pressure (in thermal pressure section)
-                            elif current_section == 'thermal pressure' and 'current pressure level:' in line_lower:
-                                try:
-                                    pressure_match = line_stripped.split(
-                                        'Current pressure level:')[-1].strip()
-                                    if not IS_PRODUCTION:
-                                        print(
-                                            f"[DEBUG] Thermal pressure level: {pressure_match}")
-
-                                    # Convert pressure level to estimated temperature
-                                    pressure_to_temp = {
-                                        'Nominal': 45.0,
-                                        'Fair': 65.0,
-                                        'Serious': 80.0,
-                                        'Critical': 95.0
-                                    }
-
-                                    estimated_temp = pressure_to_temp.get(
-                                        pressure_match, 50.0)
-                                    temperature_sensors.append({
-                                        "label": "CPU Temperature",
-                                        "value": estimated_temp,
-                                        "unit": "°C",
-                                        "status": pressure_match,
-                                        "type": "temperature",
-                                        "key": "label"
-                                    })
-                                    sensors_found = True
-                                except (ValueError, IndexError):
-                                    continue
-
-                            # Parse GPU metrics (in GPU usage section)
-                            elif current_section == 'gpu usage':
-                                if 'gpu hw active frequency:' in line_lower:
-                                    try:
-                                        freq_match = line_stripped.split(
-                                            'GPU HW active frequency:')[-1].strip()
-                                        if 'MHz' in freq_match:
-                                            freq_value = float(
-                                                freq_match.replace('MHz', '').strip())
-                                            temperature_sensors.append({
-                                                "label": "GPU Frequency",
-                                                "value": freq_value,
-                                                "unit": "MHz",
-                                                "status": "Active" if freq_value > 400 else "Idle",
-                                                "type": "frequency",
-                                                "key": "label"
-                                            })
-                                            sensors_found = True
-                                            if not IS_PRODUCTION:
-                                                print(
-                                                    f"[DEBUG] Found GPU Frequency: {freq_value} MHz")
-                                    except (ValueError, IndexError):
-                                        continue
-
-                        if not sensors_found and not IS_PRODUCTION:
-                            print(
-                                "[DEBUG] No temperature data found in powermetrics output")
+                        temperature_sensors.extend(found)
+                        for sensor in found:
+                            logger.debug("Found %s: %s %s", sensor['label'],
+                                         sensor['value'], sensor['unit'])
+                        if not found:
+                            logger.debug(
+                                "No temperature data found in powermetrics output")
                     else:
-                        if not IS_PRODUCTION:
-                            print(
-                                f"[DEBUG] powermetrics failed with return code {process.returncode}")
+                        if use_ticket:
+                            # The ticket expired; pipe the password next time
+                            SUDO_TICKET.clear()
+                        if timed_out:
+                            logger.debug("powermetrics command timed out")
+                        else:
+                            logger.debug(
+                                "powermetrics failed with return code %s", process.returncode)
 
-                except subprocess.TimeoutExpired:
-                    if not IS_PRODUCTION:
-                        print("[DEBUG] powermetrics command timed out")
                 except FileNotFoundError:
-                    if not IS_PRODUCTION:
-                        print("[DEBUG] powermetrics command not found")
+                    logger.debug("powermetrics command not found")
                 except Exception as e:
-                    if not IS_PRODUCTION:
-                        print(
-                            f"[DEBUG] Unexpected error with powermetrics: {e}")
+                    logger.debug("Unexpected error with powermetrics: %s", e)
             else:
-                if not IS_PRODUCTION:
-                    print(
-                        "[DEBUG] No system password provided for macOS temperature reading")
+                logger.debug(
+                    "No system password provided for macOS temperature reading")
         elif system == 'windows':
             try:
-                # Try wmic for CPU temperature
+                # Try wmic for CPU temperature; run it directly rather than
+                # through cmd.exe, and without allocating a console window
                 result = subprocess.run(['wmic', '/namespace:\\\\root\\wmi', 'PATH', 'MSAcpi_ThermalZoneTemperature',
-                                         'get', 'CurrentTemperature'], capture_output=True, text=True, shell=True)
+                                         'get', 'CurrentTemperature'], capture_output=True, text=True,
+                                        creationflags=subprocess.CREATE_NO_WINDOW)
                 if result.returncode == 0:
                     lines = result.stdout.split('\n')
                     for line in lines:
@@ -344,7 +557,7 @@ def get_temperature_data(system_password=None):
                                     "label": "CPU Temperature",
                                     "value": round(temp_celsius, 1),
                                     "unit": "°C",
-                                    "status": "Normal" if temp_celsius < 80 else "Hot",
+                                    "status": temperature_status(temp_celsius),
                                     "type": "temperature",
                                     "key": "label"
                                 })
@@ -372,59 +585,68 @@ def get_temperature_data(system_password=None):
     return temperature_sensors
 
 
-def get_client_ips():
-    """Get both external and local IP addresses"""
-    external_ip = None
-    local_ip = None
+# The external IP costs an HTTPS round trip to ipify, so it is kept for an
+# hour; the local IP is a couple of syscalls and is refreshed more often
+_EXTERNAL_IP_TTL = 3600
+# After a failed ipify lookup, keep serving the last known IP this long
+_EXTERNAL_IP_RETRY = 60
+_LOCAL_IP_TTL = 300
+_IP_CACHE = {"ext": None, "ext_exp": 0.0, "loc": None, "loc_exp": 0.0}
+
+
+def invalidate_ip_cache(signum=None, frame=None):
+    """Force both IPs to be looked up again on the next tick (SIGHUP)"""
+    _IP_CACHE.update(ext_exp=0.0, loc_exp=0.0)
+
+
+def get_local_ip():
+    """Get the LAN address of the interface that routes outbound traffic
+
+    Connecting a UDP socket sends no packets; it only makes the kernel pick
+    the source address, which saves forking ipconfig/ifconfig.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.connect(('8.8.8.8', 80))
+        return sock.getsockname()[0]
+
+
+def get_external_ip():
+    """Get the public IP from ipify, cached for _EXTERNAL_IP_TTL seconds"""
+    if time.monotonic() < _IP_CACHE["ext_exp"]:
+        return _IP_CACHE["ext"]
 
-    # Get external IP from service
     try:
-        response = requests.get('https://api.ipify.org', timeout=5)
+        response = SESSION.get('https://api.ipify.org', timeout=5)
         if response.status_code == 200:
-            external_ip = response.text.strip()
-    except:
+            _IP_CACHE.update(ext=response.text.strip(),
+                             ext_exp=time.monotonic() + _EXTERNAL_IP_TTL)
+            return _IP_CACHE["ext"]
+    except requests.exceptions.RequestException:
         pass
 
-    # Get local IP using platform-specific commands
-    try:
-        import platform
-        system = platform.system().lower()
-
-        if system == 'windows':
-            # Use ipconfig on Windows
-            result = subprocess.run(
-                ['ipconfig'], capture_output=True, text=True, shell=True)
-            if result.returncode == 0:
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if 'IPv4 Address' in line or 'IP Address' in line:
-                        # Extract IP from lines like "   IPv4 Address. . . . . . . . . . . : 192.168.1.100"
-                        if ':' in line:
-                            ip = line.split(':')[-1].strip()
-                            if ip and ip != '127.0.0.1' and not ip.startswith('169.254'):
-                                local_ip = ip
-                                break
-        else:
-            # Use ifconfig on Linux/macOS
-            result = subprocess.run(
-                ['ifconfig'], capture_output=True, text=True)
-            if result.returncode == 0:
-                lines = result.stdout.split('\n')
-                for line in lines:
-                    if 'inet ' in line and '127.0.0.1' not in line and 'inet 169.254' not in line:
-                        # Extract IP address from line like "inet 192.168.1.100 netmask 0xffffff00 broadcast 192.168.1.255"
-                        parts = line.strip().split()
-                        if len(parts) >= 2:
-                            local_ip = parts[1]
-                            break
-    except:
-        local_ip = "127.0.0.1"
-
-    return external_ip, local_ip
-
-
-def send_to_webhook(data, webhook_url=None, api_secret=None, environment=None, system_password=None):
-    """Send data to webhook endpoint"""
+    # Serve the stale IP for a while; with nothing cached, retry next tick
+    if _IP_CACHE["ext"] is not None:
+        _IP_CACHE["ext_exp"] = time.monotonic() + _EXTERNAL_IP_RETRY
+    return _IP_CACHE["ext"]
+
+
+def get_client_ips():
+    """Get both external and local IP addresses"""
+    external_ip = get_external_ip()
+
+    if time.monotonic() >= _IP_CACHE["loc_exp"]:
+        # Get local IP from the socket layer
+        try:
+            _IP_CACHE.update(loc=get_local_ip(),
+                             loc_exp=time.monotonic() + _LOCAL_IP_TTL)
+        except OSError:
+            return external_ip, "127.0.0.1"
+
+    return external_ip, _IP_CACHE["loc"]
+
+
+def resolve_webhook_target(webhook_url=None, api_secret=None, environment=None):
+    """Webhook URL and secret from arguments or environment variables"""
     # Use command line arguments or environment variables
     env = environment or os.getenv('ENV', 'development')
 
@@ -438,31 +660,90 @@ def send_to_webhook(data, webhook_url=None, api_secret=None, environment=None, s
             webhook_url = os.getenv('GLANCES_WEBHOOK_URL_DEV')
 
     secret = api_secret or os.getenv('GLANCES_SECRET')
+    return webhook_url, secret
 
-    headers = {
-        'Content-Type': 'application/json',
-        'X-Secret': secret
-    }
-    if not webhook_url or not secret:
-        print("❌ Webhook URL or API key not configured")
-        return None, "Webhook URL or API key not configured"
 
+def add_client_context(data, system_password=None, client_ips=None, temperature_data=None):
+    """Add client IPs and temperature sensors to a Glances sample
+
+    client_ips and temperature_data can be collected ahead of time (see
+    main); they are looked up here when not given.
+    """
     # Add client IPs to the data
-    external_ip, local_ip = get_client_ips()
+    external_ip, local_ip = client_ips if client_ips is not None else get_client_ips()
     data['external_ip'] = external_ip
     data['local_ip'] = local_ip
 
     # Add temperature data to sensors
-    temperature_data = get_temperature_data(system_password)
+    if temperature_data is None:
+        temperature_data = get_temperature_data(system_password)
     if 'sensors' not in data:
         data['sensors'] = []
 
     # Append temperature sensors to existing sensors
     data['sensors'].extend(temperature_data)
 
+
+def send_to_webhook(data, webhook_url=None, api_secret=None, environment=None, system_password=None,
+                    client_ips=None, temperature_data=None):
+    """Send data to webhook endpoint"""
+    webhook_url, secret = resolve_webhook_target(
+        webhook_url, api_secret, environment)
+    if not webhook_url or not secret:
+        print("❌ Webhook URL or API key not configured")
+        return None, "Webhook URL or API key not configured"
+
+    add_client_context(data, system_password, client_ips, temperature_data)
+
+    try:
+        response = SESSION.post(
+            webhook_url, data=encode_json(data), headers=webhook_headers(secret), timeout=10)
+        return response.status_code, response.json()
+    except requests.exceptions.RequestException as e:
+        return None, str(e)
+
+
+# Matches the server's per-request limit; past it the oldest buffered
+# samples are dropped while the webhook keeps failing
+MAX_BUFFERED_SAMPLES = 500
+# Retry delays after a connection error or 5xx double up to this many seconds
+MAX_BATCH_RETRY_DELAY = 300
+
+
+def batch_send_retryable(status_code):
+    """Whether a failed batch may succeed later (no response, or a 5xx)
+
+    Other non-2xx answers (401, 413, 422, ...) reject the batch itself, so
+    resending the same samples cannot help.
+    """
+    return status_code is None or status_code >= 500
+
+
+def send_batch_to_webhook(samples, webhook_url=None, api_secret=None, environment=None):
+    """Send buffered samples to the batch webhook endpoint in one POST
+
+    samples is a list of (data, collected_at) pairs, where data already has
+    its client context and collected_at is a time.monotonic() reading. The
+    server uses age_seconds to store each sample with its collection time.
+    """
+    webhook_url, secret = resolve_webhook_target(
+        webhook_url, api_secret, environment)
+    if not webhook_url or not secret:
+        print("❌ Webhook URL or API key not configured")
+        return None, "Webhook URL or API key not configured"
+
+    now = time.monotonic()
+    body = {
+        'snapshots': [
+            dict(data, age_seconds=round(now - collected_at, 3))
+            for data, collected_at in samples
+        ]
+    }
+
     try:
-        response = requests.post(
-            webhook_url, json=data, headers=headers, timeout=10)
+        response = SESSION.post(
+            webhook_url.rstrip('/') + '/batch', data=encode_json(body),
+            headers=webhook_headers(secret), timeout=10)
         return response.status_code, response.json()
     except requests.exceptions.RequestException as e:
         return None, str(e)
@@ -482,11 +763,27 @@ def parse_arguments():
                         help='Interval between sends in seconds (default: 5)')
     parser.add_argument('--system-password', type=str,
                         help='System password for sudo operations (macOS only)')
-    return parser.parse_args()
+    parser.add_argument('--batch-size', '-b', type=int, default=1,
+                        help='Samples to buffer per webhook POST (default: 1, send each sample)')
+    parser.add_argument('--batch-wait', type=int, default=30,
+                        help='Maximum seconds to hold buffered samples (default: 30)')
+    args = parser.parse_args()
+    if args.batch_size > MAX_BUFFERED_SAMPLES:
+        parser.error(f'--batch-size must be at most {MAX_BUFFERED_SAMPLES}')
+    # --environment wins; otherwise fall back to the ENV variable
+    args.is_production = (
+        args.environment or os.getenv('ENV', '')).lower() == 'production'
+    return args
 
 
 def main():
+    global POWERMETRICS_STREAM
     args = parse_arguments()
+    # Debug output keeps its "[DEBUG] ..." shape in development and is
+    # dropped before formatting in production. Only this script's logger
+    # goes to DEBUG so urllib3's connection chatter stays quiet
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    logger.setLevel(logging.INFO if args.is_production else logging.DEBUG)
 
     print("🚀 Starting Real Glances Data Sender")
     print("📊 Collecting and sending real system metrics...")
@@ -496,28 +793,105 @@ def main():
         print(f"🌍 Environment: {args.environment}")
     if args.interval:
         print(f"⏱️ Interval: {args.interval} seconds")
+    if args.batch_size > 1:
+        print(
+            f"📦 Batching: up to {args.batch_size} samples or {args.batch_wait} seconds per POST")
     print("Press Ctrl+C to stop\n")
 
     interval = args.interval
+    # Service managers stop the sender with SIGTERM; handle it like Ctrl+C so
+    # buffered samples are flushed on the way out
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    if hasattr(signal, 'SIGHUP'):
+        # `kill -HUP` after a network change refreshes the cached IPs
+        signal.signal(signal.SIGHUP, invalidate_ip_cache)
+    if SYSTEM == 'darwin' and args.system_password:
+        start_sudo_keepalive(args.system_password)
+        if SUDO_TICKET.is_set():
+            # Until its first sample is complete, ticks fall back to a
+            # one-shot powermetrics run
+            POWERMETRICS_STREAM = PowermetricsStream(interval)
+            POWERMETRICS_STREAM.start()
+    # The Glances fetch, IP lookup and temperature read are independent
+    # waits, so each tick runs them side by side
+    executor = ThreadPoolExecutor(max_workers=3)
+    # (data, collected_at) samples waiting for the next batch POST; kept
+    # across retryable failures until the webhook accepts them
+    buffer = collections.deque(maxlen=MAX_BUFFERED_SAMPLES)
+    last_flush = time.monotonic()
+    # Backoff after a retryable failure: no batch POST before retry_at
+    retry_delay = 0
+    retry_at = 0.0
+    # Ticks are scheduled at start + k * interval so the work time of each
+    # tick doesn't push the following ones later
+    next_tick = time.monotonic()
 
     try:
         while True:
             # Get real system data
-            glances_data = get_real_glances_data()
-
-            if glances_data:
+            glances_future = executor.submit(get_real_glances_data)
+            ips_future = executor.submit(get_client_ips)
+            temperature_future = executor.submit(
+                get_temperature_data, args.system_password)
+            glances_data = glances_future.result()
+
+            if glances_data and args.batch_size > 1:
+                add_client_context(
+                    glances_data,
+                    client_ips=ips_future.result(),
+                    temperature_data=temperature_future.result()
+                )
+                buffer.append((glances_data, time.monotonic()))
+
+                timestamp = time.strftime('%H:%M:%S')
+                now = time.monotonic()
+                batch_due = len(buffer) >= args.batch_size or now - last_flush >= args.batch_wait
+                if batch_due and now >= retry_at:
+                    # Send everything buffered so far in one request
+                    status_code, response = send_batch_to_webhook(
+                        buffer,
+                        webhook_url=args.webhook_url,
+                        api_secret=args.api_secret,
+                        environment=args.environment
+                    )
+                    if status_code is not None and 200 <= status_code < 300:
+                        print(
+                            f"✅ [{timestamp}] Batch sent: {response.get('message', '')}")
+                        buffer.clear()
+                        retry_delay = 0
+                    elif batch_send_retryable(status_code):
+                        retry_delay = min(
+                            max(retry_delay * 2, interval), MAX_BATCH_RETRY_DELAY)
+                        retry_at = time.monotonic() + retry_delay
+                        print(
+                            f"❌ [{timestamp}] Failed to send batch of {len(buffer)}, retrying in {retry_delay}s: {status_code} - {response}")
+                    else:
+                        print(
+                            f"❌ [{timestamp}] Batch of {len(buffer)} rejected, dropping it: {status_code} - {response}")
+                        buffer.clear()
+                        retry_delay = 0
+                    last_flush = time.monotonic()
+                elif batch_due:
+                    print(
+                        f"📥 [{timestamp}] Sample buffered ({len(buffer)}), next send attempt in {retry_at - now:.1f}s")
+                else:
+                    print(
+                        f"📥 [{timestamp}] Sample buffered ({len(buffer)}/{args.batch_size})")
+            elif glances_data:
                 # Send to webhook
                 status_code, response = send_to_webhook(
                     glances_data,
                     webhook_url=args.webhook_url,
                     api_secret=args.api_secret,
                     environment=args.environment,
-                    system_password=args.system_password
+                    system_password=args.system_password,
+                    client_ips=ips_future.result(),
+                    temperature_data=temperature_future.result()
                 )
 
-                timestamp = datetime.now().strftime('%H:%M:%S')
+                timestamp = time.strftime('%H:%M:%S')
 
-                if status_code == 200:
+                if status_code in (200, 202):
                     # Extract key metrics for display
                     cpu_percent = glances_data.get(
                         'cpu', {}).get('total', 'N/A')
@@ -536,17 +910,40 @@ def main():
                     print(
                         f"❌ [{timestamp}] Failed to send data: {status_code} - {response}")
             else:
+                # Nothing to send, but let the IP lookup and temperature read
+                # finish: the next tick's read would otherwise share the
+                # thermal fd cache with this one
+                wait((ips_future, temperature_future))
                 print(
-                    f"⚠️  [{datetime.now().strftime('%H:%M:%S')}] Failed to get Glances data")
+                    f"⚠️  [{time.strftime('%H:%M:%S')}] Failed to get Glances data")
 
             print()  # Empty line for readability
-            time.sleep(interval)
+            next_tick += interval
+            slack = next_tick - time.monotonic()
+            if slack > 0:
+                time.sleep(slack)
+            else:
+                # Overran the interval: start the next tick now instead of
+                # firing a burst of catch-up ticks
+                next_tick = time.monotonic()
 
     except KeyboardInterrupt:
+        if buffer:
+            # Don't drop samples that are still waiting for a batch
+            send_batch_to_webhook(
+                buffer,
+                webhook_url=args.webhook_url,
+                api_secret=args.api_secret,
+                environment=args.environment
+            )
         print("\n🛑 Stopped by user")
     except Exception as e:
         print(f"\n💥 Unexpected error: {e}")
         sys.exit(1)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if POWERMETRICS_STREAM is not None:
+            POWERMETRICS_STREAM.stop()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,92 @@
+"""
+Shared pytest fixtures for the Machine Hub API
+"""
+
+import contextlib
+from datetime import datetime
+import os
+import sys
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+# Make the API package importable from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__))), 'machine-hub-api'))
+
+from app import crud, auth, schemas  # noqa: E402
+from app.database import Base, get_db  # noqa: E402
+from app.routers import machines_router, webhook_router  # noqa: E402
+
+
+@contextlib.contextmanager
+def count_queries(connection):
+    """Collect every SQL statement executed on a connection or engine"""
+    queries = []
+
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        queries.append(statement)
+
+    event.listen(connection, 'before_cursor_execute', _before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(connection, 'before_cursor_execute',
+                     _before_cursor_execute)
+
+
+@pytest.fixture
+def query_counter():
+    """Context manager factory: `with query_counter(bind) as queries: ...`"""
+    return count_queries
+
+
+@pytest.fixture
+def db_session():
+    """In-memory database session with the full schema created"""
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False,
+                           expire_on_commit=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
+
+
+@pytest.fixture
+def api_client(db_session, monkeypatch):
+    """TestClient for the machines and webhook routers on db_session
+
+    Authentication is bypassed and no webhook secret is required. The
+    background snapshot writer is not started: snapshots it would store are
+    collected in api_client.queued instead.
+    """
+    monkeypatch.delenv("GLANCES_SECRET", raising=False)
+    crud.invalidate_machine_lookups()
+
+    app = FastAPI()
+    app.include_router(machines_router.router, prefix="/api/machines")
+    app.include_router(webhook_router.router, prefix="/webhook")
+    app.dependency_overrides[get_db] = lambda: db_session
+    app.dependency_overrides[auth.get_current_active_user] = lambda: schemas.User(
+        id=1, username="admin", is_active=True, created_at=datetime.utcnow())
+
+    client = TestClient(app)
+    client.queued = []
+
+    async def enqueue(snapshot):
+        client.queued.append(snapshot)
+
+    monkeypatch.setattr(webhook_router.snapshot_writer, "enqueue", enqueue)
+    yield client
+    crud.invalidate_machine_lookups()
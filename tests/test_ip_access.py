@@ -3,8 +3,12 @@
 Test script to verify IP-based access control for webhook endpoint
 """
 
-import requests
+import argparse
 import json
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
 
 # Test data
 test_data = {
@@ -22,39 +26,80 @@ headers = {
 
 webhook_url = 'http://localhost:3009/webhook/glances'
 
+# Upper bound on requests in flight when probing several hosts
+MAX_PARALLEL = 16
+
+
+def report_response(url, response):
+    """Print how one webhook endpoint answered"""
+    print(f"[{url}] Status Code: {response.status_code}")
+    print(f"Response Headers: {dict(response.headers)}")
+    print(f"Response Body: {response.text}")
+
+    if response.status_code == 403:
+        print("\n✅ IP-based access control is working!")
+        print("   The request was blocked because the client IP is not registered.")
+    elif 200 <= response.status_code < 300:
+        # The webhook answers 202 Accepted; storage happens in the background
+        print(
+            "\n⚠️  Request was accepted - check if your IP is registered in machines table.")
+    else:
+        print(f"\n❓ Unexpected response code: {response.status_code}")
+
+
+def test_webhook_access(urls=None, session=None, count=1):
+    """Test webhook access control
+
+    Each URL is hit `count` times, in parallel, over one pooled session so
+    repeated probes of a host reuse its connection.
+    """
+    urls = list(urls or [webhook_url]) * count
+    workers = min(len(urls), MAX_PARALLEL)
+    owns_session = session is None
+    if owns_session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=workers)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
 
-def test_webhook_access():
-    """Test webhook access control"""
     print("Testing webhook IP-based access control...")
-    print(f"Sending request to: {webhook_url}")
+    print(f"Sending {len(urls)} request(s) to: {', '.join(dict.fromkeys(urls))}")
     print(f"Headers: {headers}")
     print(f"Data: {json.dumps(test_data, indent=2)}")
     print("\n" + "="*50)
 
     try:
-        response = requests.post(
-            webhook_url,
-            json=test_data,
-            headers=headers,
-            timeout=10
-        )
-
-        print(f"Status Code: {response.status_code}")
-        print(f"Response Headers: {dict(response.headers)}")
-        print(f"Response Body: {response.text}")
-
-        if response.status_code == 403:
-            print("\n✅ IP-based access control is working!")
-            print("   The request was blocked because the client IP is not registered.")
-        elif response.status_code == 200:
-            print(
-                "\n⚠️  Request was accepted - check if your IP is registered in machines table.")
-        else:
-            print(f"\n❓ Unexpected response code: {response.status_code}")
-
-    except requests.exceptions.RequestException as e:
-        print(f"❌ Request failed: {e}")
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(session.post, url, json=test_data,
+                                headers=headers, timeout=10)
+                for url in urls
+            ]
+            for url, future in zip(urls, futures):
+                try:
+                    report_response(url, future.result())
+                except requests.exceptions.RequestException as e:
+                    print(f"❌ [{url}] Request failed: {e}")
+    finally:
+        # A session passed in by the caller stays open for its next use
+        if owns_session:
+            session.close()
+
+
+def positive_int(value):
+    """argparse type for --count: the worker pool needs at least one request"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
 
 
 if __name__ == "__main__":
-    test_webhook_access()
+    parser = argparse.ArgumentParser(
+        description='Check IP-based access control on webhook endpoints')
+    parser.add_argument('urls', nargs='*',
+                        help=f'Webhook URLs to probe (default: {webhook_url})')
+    parser.add_argument('--count', '-n', type=positive_int, default=1,
+                        help='Requests to send to each URL (default: 1)')
+    args = parser.parse_args()
+    test_webhook_access(args.urls, count=args.count)
@@ -0,0 +1,36 @@
+"""
+Machine create/update: duplicate hostnames come back as 400, not 500
+"""
+
+
+def machine_body(hostname, ip_address):
+    return {"name": hostname, "hostname": hostname, "ip_address": ip_address}
+
+
+def test_create_with_taken_hostname_is_rejected(api_client):
+    response = api_client.post(
+        "/api/machines/", json=machine_body("host", "192.168.0.1"))
+    assert response.status_code == 200
+
+    response = api_client.post(
+        "/api/machines/", json=machine_body("host", "192.168.0.2"))
+    assert response.status_code == 400
+    assert "hostname" in response.json()["detail"]
+
+    # The session is usable again after the rolled back insert
+    assert len(api_client.get("/api/machines/").json()) == 1
+
+
+def test_update_to_taken_hostname_is_rejected(api_client):
+    api_client.post("/api/machines/", json=machine_body("one", "192.168.0.1"))
+    second = api_client.post(
+        "/api/machines/", json=machine_body("two", "192.168.0.2")).json()
+
+    response = api_client.put(
+        f"/api/machines/{second['id']}", json={"hostname": "one"})
+    assert response.status_code == 400
+
+    response = api_client.put(
+        f"/api/machines/{second['id']}", json={"hostname": "three"})
+    assert response.status_code == 200
+    assert response.json()["hostname"] == "three"
@@ -0,0 +1,51 @@
+"""
+POST /api/machines/power: one result per requested machine, in request order
+"""
+
+from app import models
+from app.routers import machines_router
+
+
+def seed_machines(db, count=3):
+    for i in range(count):
+        db.add(models.Machine(name=f"machine-{i}", hostname=f"host-{i}",
+                              ip_address=f"192.168.0.{i + 1}",
+                              mac_address=f"00:11:22:33:44:{i:02x}"))
+    db.commit()
+
+
+def test_bulk_power_keeps_request_order(api_client, db_session, monkeypatch):
+    seed_machines(db_session)
+    woken = []
+
+    def wake_machine(machine):
+        woken.append(machine.id)
+        return {"success": True, "message": f"Wake sent to {machine.name}"}
+
+    monkeypatch.setattr(machines_router, "wake_machine", wake_machine)
+
+    response = api_client.post("/api/machines/power", json={
+        "machine_ids": [3, 42, 1, 3], "action": "wake"})
+
+    assert response.status_code == 200
+    results = response.json()
+    # Duplicates collapse to one result; unknown ids fail on their own
+    assert [r["machine_id"] for r in results] == [3, 42, 1]
+    assert [r["success"] for r in results] == [True, False, True]
+    assert results[1]["message"] == "Machine not found"
+    assert all(r["action"] == "wake" for r in results)
+    assert sorted(woken) == [1, 3]
+
+
+def test_bulk_power_limits_machine_ids(api_client):
+    response = api_client.post("/api/machines/power", json={
+        "machine_ids": list(range(1, 102)), "action": "wake"})
+
+    assert response.status_code == 422
+
+
+def test_bulk_power_requires_machine_ids(api_client):
+    response = api_client.post("/api/machines/power", json={
+        "machine_ids": [], "action": "wake"})
+
+    assert response.status_code == 422
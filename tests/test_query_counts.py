@@ -0,0 +1,112 @@
+"""
+Query budgets for list paths that used to issue one query per machine
+"""
+
+import pytest
+from sqlalchemy.exc import InvalidRequestError
+
+from app import crud, models
+
+
+def seed_machines(db, count=5, snapshots_per_machine=3):
+    for i in range(count):
+        machine = models.Machine(
+            name=f"machine-{i}",
+            hostname=f"host-{i}",
+            ip_address=f"192.168.0.{i + 1}",
+            is_active=True
+        )
+        db.add(machine)
+        db.flush()
+        for cpu in range(snapshots_per_machine):
+            db.add(models.SystemSnapshot(
+                machine_id=machine.id, cpu_percent=float(cpu)))
+    db.commit()
+    db.expunge_all()
+
+
+def test_machines_with_latest_snapshots_is_one_query(db_session, query_counter):
+    seed_machines(db_session)
+
+    with query_counter(db_session.get_bind()) as queries:
+        result = crud.get_machines_with_latest_snapshots(db_session)
+
+    assert len(result) == 5
+    assert all(snapshot.cpu_percent == 2.0 for _, snapshot in result)
+    assert len(queries) <= 1
+
+
+def test_get_machines_eager_loads_snapshots(db_session, query_counter):
+    seed_machines(db_session)
+
+    with query_counter(db_session.get_bind()) as queries:
+        machines = crud.get_machines(db_session, load_snapshots=True)
+        snapshot_total = sum(len(machine.snapshots) for machine in machines)
+
+    assert snapshot_total == 15
+    assert len(queries) <= 2
+
+
+def test_get_machines_by_ids_is_one_query(db_session, query_counter):
+    seed_machines(db_session)
+
+    with query_counter(db_session.get_bind()) as queries:
+        machines = crud.get_machines_by_ids(db_session, [1, 3, 42])
+
+    assert sorted(machine.id for machine in machines) == [1, 3]
+    assert len(queries) == 1
+
+
+def test_get_machines_refuses_lazy_snapshot_loads(db_session):
+    seed_machines(db_session, count=1)
+
+    machine = crud.get_machines(db_session)[0]
+    with pytest.raises(InvalidRequestError):
+        machine.snapshots
+
+
+def test_snapshot_history_skips_payload_columns(db_session):
+    seed_machines(db_session, count=1)
+
+    snapshot = crud.get_machine_snapshots(db_session, machine_id=1)[0]
+    assert "cpu_percent" in snapshot._mapping
+    assert not crud.SNAPSHOT_PAYLOAD_COLUMNS & set(snapshot._mapping.keys())
+
+    snapshot = crud.get_machine_snapshots(
+        db_session, machine_id=1, include_payload=True)[0]
+    assert crud.SNAPSHOT_PAYLOAD_COLUMNS <= set(snapshot._mapping.keys())
+
+
+def test_ip_lookup_prefers_earlier_ip_when_cache_is_partial(db_session, query_counter):
+    seed_machines(db_session, count=2)
+    crud.invalidate_machine_lookups()
+
+    # Only the lower-priority IP is cached
+    assert crud.get_machine_ref_by_any_ip(db_session, ["192.168.0.2"]).id == 2
+
+    machine = crud.get_machine_ref_by_any_ip(
+        db_session, ["192.168.0.1", "192.168.0.2"])
+    assert machine.id == 1
+
+    # Every IP is cached now, including the miss
+    with query_counter(db_session.get_bind()) as queries:
+        machine = crud.get_machine_ref_by_any_ip(
+            db_session, ["10.9.9.9", "192.168.0.2"])
+        machine = crud.get_machine_ref_by_any_ip(
+            db_session, ["10.9.9.9", "192.168.0.2"])
+    assert machine.id == 2
+    assert len(queries) == 1
+    crud.invalidate_machine_lookups()
+
+
+def test_ip_lookup_cache_is_bounded(db_session, monkeypatch):
+    seed_machines(db_session, count=1)
+    crud.invalidate_machine_lookups()
+    monkeypatch.setattr(crud, "MACHINE_LOOKUP_MAX_SIZE", 10)
+
+    # Unregistered IPs straight from webhook payloads
+    for i in range(50):
+        crud.get_machine_ref_by_any_ip(db_session, [f"10.0.{i}.1", f"10.1.{i}.1"])
+
+    assert len(crud._machine_lookup_cache) <= 10
+    crud.invalidate_machine_lookups()
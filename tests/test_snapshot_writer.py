@@ -0,0 +1,58 @@
+"""
+Shutdown and failure handling of the batched snapshot writer
+"""
+
+import asyncio
+
+from sqlalchemy.orm import sessionmaker
+
+from app import models
+from app.services.snapshot_writer import SnapshotWriter
+
+
+def make_writer(db, **kwargs):
+    machine = models.Machine(name="machine", hostname="host",
+                             ip_address="192.168.0.1", is_active=True)
+    db.add(machine)
+    db.commit()
+    factory = sessionmaker(bind=db.get_bind(), expire_on_commit=False)
+    return machine.id, SnapshotWriter(session_factory=factory, **kwargs)
+
+
+def snapshot_count(db):
+    return db.query(models.SystemSnapshot).count()
+
+
+def test_stop_flushes_partial_batch(db_session):
+    machine_id, writer = make_writer(
+        db_session, batch_size=500, flush_interval=30.0)
+
+    async def run():
+        for cpu in range(10):
+            await writer.enqueue({"machine_id": machine_id,
+                                  "cpu_percent": float(cpu)})
+        # Let the loop pull the snapshots into its batch before stopping
+        await asyncio.sleep(0.1)
+        await writer.stop()
+
+    asyncio.run(run())
+
+    assert snapshot_count(db_session) == 10
+
+
+def test_bad_row_only_drops_itself(db_session):
+    machine_id, writer = make_writer(
+        db_session, batch_size=500, flush_interval=30.0)
+
+    async def run():
+        await writer.enqueue({"machine_id": machine_id, "cpu_percent": 1.0})
+        # machine_id is NOT NULL, so this row fails the multi-row INSERT
+        await writer.enqueue({"machine_id": None, "cpu_percent": 2.0})
+        await writer.enqueue({"machine_id": machine_id, "cpu_percent": 3.0})
+        await writer.stop()
+
+    asyncio.run(run())
+
+    stored = sorted(s.cpu_percent for s in
+                    db_session.query(models.SystemSnapshot))
+    assert stored == [1.0, 3.0]
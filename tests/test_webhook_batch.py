@@ -0,0 +1,68 @@
+"""
+/webhook/glances/batch: limits, partial acceptance and rejection
+"""
+
+from app import models
+from app.routers.webhook_router import MAX_BATCH_SAMPLES
+
+
+def add_machine(db, ip_address="192.168.0.1"):
+    machine = models.Machine(name="machine", hostname="host",
+                             ip_address=ip_address, is_active=True)
+    db.add(machine)
+    db.commit()
+    return machine.id
+
+
+def sample(local_ip="192.168.0.1", **extra):
+    return dict({"local_ip": local_ip, "cpu": {"total": 12.5},
+                 "system": {"hostname": "host"}}, **extra)
+
+
+def test_batch_queues_valid_samples(api_client, db_session):
+    machine_id = add_machine(db_session)
+
+    response = api_client.post("/webhook/glances/batch", json={"snapshots": [
+        sample(age_seconds=60), "not a sample", sample(local_ip="10.9.9.9")]})
+
+    assert response.status_code == 202
+    body = response.json()
+    assert body["queued"] == 1
+    assert [result["success"] for result in body["results"]] == [
+        True, False, False]
+    assert [s["machine_id"] for s in api_client.queued] == [machine_id]
+    assert api_client.queued[0]["cpu_percent"] == 12.5
+    assert "created_at" in api_client.queued[0]
+
+
+def test_batch_with_nothing_to_store_is_rejected(api_client, db_session):
+    add_machine(db_session)
+
+    response = api_client.post("/webhook/glances/batch", json={
+        "snapshots": [sample(local_ip="10.9.9.9"), 5]})
+
+    assert response.status_code == 422
+    assert len(response.json()["detail"]["results"]) == 2
+    assert api_client.queued == []
+
+
+def test_empty_batch_is_rejected(api_client):
+    response = api_client.post("/webhook/glances/batch", json={"snapshots": []})
+
+    assert response.status_code == 422
+
+
+def test_batch_size_is_limited(api_client, db_session):
+    add_machine(db_session)
+
+    response = api_client.post("/webhook/glances/batch", json={
+        "snapshots": [sample()] * (MAX_BATCH_SAMPLES + 1)})
+
+    assert response.status_code == 413
+    assert api_client.queued == []
+
+
+def test_batch_requires_snapshots_list(api_client):
+    response = api_client.post("/webhook/glances/batch", json=[sample()])
+
+    assert response.status_code == 400
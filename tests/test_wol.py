@@ -1,6 +1,13 @@
 #!/usr/bin/env python3
-import requests
+import asyncio
+import base64
 import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import httpx
 
 # Base URL for the API
 base_url = "http://localhost:8009"
@@ -18,71 +25,208 @@ machines = [
     {"id": 2, "name": "3900x"}
 ]
 
+# Request bodies never change during a run, so encode them once; the client
+# already sends Content-Type: application/json
+LOGIN_BODY = json.dumps({
+    "username": test_user["username"],
+    "password": test_user["password"]
+}).encode()
+REGISTER_BODY = json.dumps(test_user).encode()
+WAKE_BODY = json.dumps({
+    "machine_ids": [machine["id"] for machine in machines],
+    "action": "wake"
+}).encode()
 
-def get_auth_token():
-    """Get JWT token for authentication"""
-    # Try to register user first (in case it doesn't exist)
-    register_url = f"{base_url}/api/auth/register"
+# Transient gateway errors are retried with exponential backoff; connect
+# failures are retried by the transport itself
+RETRY_STATUSES = (502, 503, 504)
+RETRIES = 3
+BACKOFF_SECONDS = 0.1
+
+
+# (url, status code, seconds) per request, and the status lines produced
+# while requests are in flight; both are printed once the requests are done
+# so terminal output never sits between them
+timings = []
+messages = []
+
+
+def report(message):
+    messages.append(message)
+
+
+def print_timings():
+    print("Request timings:")
+    for url, status_code, elapsed in timings:
+        print(f"  {url} -> {status_code} in {elapsed * 1000:.1f} ms")
+
+
+async def post(client, url, body):
+    """POST a pre-encoded body, retrying transient gateway errors"""
+    for attempt in range(RETRIES + 1):
+        started = time.perf_counter()
+        response = await client.post(url, content=body)
+        timings.append(
+            (url, response.status_code, time.perf_counter() - started))
+        if response.status_code not in RETRY_STATUSES or attempt == RETRIES:
+            return response
+        await asyncio.sleep(BACKOFF_SECONDS * 2 ** attempt)
+
+
+# Access token kept between runs so warm runs skip register + login
+TOKEN_CACHE = Path.home() / ".cache" / "machine-hub" / "token.json"
+# Treat a token this close to expiry as already expired
+TOKEN_EXPIRY_MARGIN = 30
+
+
+def token_expiry(token):
+    """Read the exp claim of a JWT (no signature check; the server does that)"""
+    payload = token.split(".")[1]
+    payload += "=" * (-len(payload) % 4)
+    return json.loads(base64.urlsafe_b64decode(payload)).get("exp", 0)
+
+
+def load_cached_token():
+    """Return the cached token for this server and user if it is still valid"""
+    try:
+        cached = json.loads(TOKEN_CACHE.read_text())
+    except (OSError, ValueError):
+        return None
+    if (cached.get("base_url") != base_url
+            or cached.get("username") != test_user["username"]
+            or cached.get("exp", 0) < time.time() + TOKEN_EXPIRY_MARGIN):
+        return None
+    return cached.get("access_token")
+
+
+def save_cached_token(token):
+    """Write the token cache, readable only by the current user"""
     try:
-        requests.post(register_url, json=test_user)
-        print("✅ Test user registered")
-    except:
-        print("ℹ️  Test user already exists or registration failed")
-
-    # Login to get token
-    login_url = f"{base_url}/api/auth/login"
-    login_data = {
-        "username": test_user["username"],
-        "password": test_user["password"]
-    }
+        record = {
+            "base_url": base_url,
+            "username": test_user["username"],
+            "access_token": token,
+            "exp": token_expiry(token)
+        }
+        TOKEN_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(TOKEN_CACHE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(record, f)
+    except (OSError, ValueError, IndexError):
+        pass
+
+
+def clear_cached_token():
+    try:
+        TOKEN_CACHE.unlink()
+    except OSError:
+        pass
+
 
+async def get_auth_token(client):
+    """Get JWT token for authentication"""
     try:
-        response = requests.post(login_url, json=login_data)
+        # Log in first; the test user normally exists already
+        response = await post(client, "/api/auth/login", LOGIN_BODY)
+        if response.status_code in (401, 404):
+            # Register the test user, then log in again
+            register = await post(client, "/api/auth/register", REGISTER_BODY)
+            if register.status_code == 200:
+                report("✅ Test user registered")
+            else:
+                report("ℹ️  Test user already exists or registration failed")
+            response = await post(client, "/api/auth/login", LOGIN_BODY)
+
         if response.status_code == 200:
             token_data = response.json()
-            print("✅ Authentication successful")
+            report("✅ Authentication successful")
+            save_cached_token(token_data["access_token"])
             return token_data["access_token"]
         else:
-            print(f"❌ Authentication failed: {response.json()}")
+            report(f"❌ Authentication failed: {response.json()}")
             return None
-    except Exception as e:
-        print(f"❌ Authentication error: {e}")
+    except (httpx.HTTPError, ValueError) as e:
+        report(f"❌ Authentication error: {e}")
         return None
 
 
-print("Testing Wake-on-LAN functionality...\n")
-
-# Get authentication token
-token = get_auth_token()
-if not token:
-    print("❌ Cannot proceed without authentication")
-    exit(1)
-
-headers = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {token}"
-}
-
-print("\nTesting Wake-on-LAN for machines...\n")
-
-for machine in machines:
-    print(f"Testing Machine ID {machine['id']} ({machine['name']}):")
+async def wake_all(client):
+    """Send the wake action for every machine in one bulk request"""
+    return await post(client, "/api/machines/power", WAKE_BODY)
 
-    # Power control endpoint with wake action
-    power_url = f"{base_url}/api/machines/{machine['id']}/power"
-    payload = {"action": "wake"}
 
+async def send_requests():
+    """Authenticate and send the bulk wake request; returns its response"""
     try:
-        response = requests.post(power_url, headers=headers, json=payload)
-        print(f"Status Code: {response.status_code}")
-        print(f"Response: {response.json()}")
+        async with httpx.AsyncClient(
+            base_url=base_url,
+            headers={"Content-Type": "application/json"},
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=10),
+                retries=RETRIES
+            )
+        ) as client:
+            # Get authentication token, from the cache when it is still valid
+            token = load_cached_token()
+            if token:
+                report("✅ Using cached authentication token")
+            else:
+                token = await get_auth_token(client)
+            if not token:
+                report("❌ Cannot proceed without authentication")
+                sys.exit(1)
+
+            client.headers["Authorization"] = f"Bearer {token}"
+
+            try:
+                response = await wake_all(client)
+                if response.status_code == 401:
+                    # A rejected cached token: log in again and retry once
+                    clear_cached_token()
+                    token = await get_auth_token(client)
+                    if token:
+                        client.headers["Authorization"] = f"Bearer {token}"
+                        response = await wake_all(client)
+            except httpx.HTTPError as e:
+                report(f"❌ Error: {e}")
+                sys.exit(1)
+    finally:
+        for message in messages:
+            print(message)
+
+    return response
+
+
+async def main():
+    print("Testing Wake-on-LAN functionality...\n")
 
-        if response.status_code == 200:
-            print("✅ Wake-on-LAN request successful")
-        else:
-            print("❌ Wake-on-LAN request failed")
-
-    except Exception as e:
-        print(f"❌ Error: {e}")
+    try:
+        response = await send_requests()
 
-    print()
+        print("\nTesting Wake-on-LAN for machines...\n")
+        print(f"Status Code: {response.status_code}")
+        if response.status_code != 200:
+            print(f"❌ Wake-on-LAN request failed: {response.text}")
+            sys.exit(1)
+
+        # One result per requested machine id
+        results = {result["machine_id"]: result for result in response.json()}
+        for machine in machines:
+            print(f"Testing Machine ID {machine['id']} ({machine['name']}):")
+            result = results.get(machine["id"])
+            print(f"Response: {result}")
+
+            if result and result["success"]:
+                print("✅ Wake-on-LAN request successful")
+            else:
+                print("❌ Wake-on-LAN request failed")
+
+            print()
+    finally:
+        # Reported on the failure exits too
+        print_timings()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())